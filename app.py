@@ -1,22 +1,17 @@
 import streamlit as st
 from datetime import date
-import tempfile
 import pandas as pd
 from io import BytesIO
 import os
 
-from nodes import app, State
-from nodes_2 import app_2, State2
-from utils.pdf_reading import extract_text_from_pdf
-from utils.ibr import *
-from utils.excel import *
+from utils.profiling import profile_stage
 
 # Initialize session state variables
 if 'result' not in st.session_state:
     st.session_state['result'] = None
 
-if 'result_2' not in st.session_state:
-    st.session_state['result_2'] = None
+if 'lease_output' not in st.session_state:
+    st.session_state['lease_output'] = None
 
 if 'wb' not in st.session_state:
     st.session_state['wb'] = None
@@ -109,101 +104,95 @@ if st.button("Start Classification Process", type="primary"):
     else:
         # Reset processing state
         st.session_state['processing_complete'] = False
-        
-        app_instance = app(State=State)
-        app_2_instance = app_2(State2=State2)
 
         status_text = st.empty()
         progress_bar = st.progress(0)
 
         status_text.text("Processing PDF...")
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
-        
-        method, extracted_text = extract_text_from_pdf(tmp_file_path, verbose=False)
-
-        status_text.text("Text from PDF extracted...")
-        progress_bar.progress(10)
-
-        # Run app_2_instance first to gather terms and conditions
-        status_text.text("Gathering Terms and Conditions...")
-        progress_bar.progress(20)
-
-        state_input = {"text": extracted_text}
-        result_2 = app_2_instance.invoke(state_input)
-        st.session_state['result_2'] = result_2
-
-        # Now run the main classification process
-        status_text.text("Running lease classification...")
-        progress_bar.progress(40)
-
-        state_input = {"text": extracted_text, "rent_abatement":result_2['terms_conditions_additional']["Rent Concessions"]}
-
-        result = app_instance.invoke(state_input)
-        st.session_state['result'] = result
-
-        # Store effective commencement date
-        if early_possession and actual_commencement_date:
-            st.session_state['effective_commencement_date'] = actual_commencement_date
-        else:
-            st.session_state['effective_commencement_date'] = result["dates"]["commencement_date"]
-
-        status_text.text("Building Worksheets...")
-        progress_bar.progress(60)
-        
-        # Store debt information
-        st.session_state['has_debt_processed'] = has_debt
-        if has_debt:
-            st.session_state['debt_data_processed'] = {
-                'commencement_date': [debt_commencement],
-                'end_date': [debt_end],
-                'measurement_date': [measurement_date],
-                'discount_rate': [discount_rate]
-            }
-        else:
-            st.session_state['debt_data_processed'] = None
-
-        status_text.text("Building Excel Workbook...")
-        progress_bar.progress(80)
-
-        # Build IBR dataframe
-        ibr_df, debt_df = build_ibr_df(st.session_state['effective_commencement_date'],
-                                    result["dates"]["end_date"],
-                                    result["discount_rate"], 
-                                    has_debt=st.session_state['has_debt_processed'], 
-                                    debt_data=st.session_state['debt_data_processed'])
-        
-        st.dataframe(ibr_df)
-        st.dataframe(debt_df)
-
-        start_date_str = result['dates']['start_date']
-        start_date = pd.to_datetime(start_date_str)
-
-        if start_date.day <= 15:
-            p_p = "Beginning"
-        else:
-            p_p = "Ending"
-
-        wb = create_workbook(
-            result['dates']['start_date'], 
-            result['dates']['end_date'], 
-            len(result['dates']['payment_dates']), 
-            result["discount_rate"]/100,
-            result['classification'],
-            [x for x in range(len(result['dates']['payment_dates']))], 
-            list(result['dates']['payment_dates'].keys()), 
-            list(result['dates']['payment_dates'].values()),
-            result_2,
-            ibr_df, debt_df,
-            float(result_2['terms_conditions_additional']["Initial Direct Costs"]['amount']),
-            -float(result_2['terms_conditions_additional']["Lease Incentives"]['amount']),
-            float(result_2['terms_conditions_options']["Prepaid Rent"]['amount']),
-            'Beginning',
-            lease_name=uploaded_file.name.split(".")[0]
-        )
-        st.session_state['wb'] = wb
+        # The graph (langgraph, langchain, the LLM client) is only loaded once a lease is submitted,
+        # so the first page renders without it; later runs reuse the imported module
+        from pipeline import lease_app, LeaseState, extract_lease, finish_lease
+        from utils.tracing import trace, span, write_metrics
+        lease_app_instance = lease_app(LeaseState=LeaseState)
+        lease_name = uploaded_file.name.split(".")[0]
+
+        # Same spans as pipeline.run_lease, so app and batch runs report the same stages
+        timings = {}
+        with trace(lease_name), span('lease'):
+            with span('extraction') as stage, profile_stage("extraction"):
+                try:
+                    extraction, state_input = extract_lease(
+                        uploaded_file.getvalue(),
+                        progress_callback=lambda done, total: status_text.text(f"Running OCR... page {done} of {total}")
+                    )
+                except ValueError:
+                    extraction = None
+            timings['extraction'] = stage['seconds']
+            if extraction is None:
+                st.error("No text could be extracted from the uploaded PDF")
+                st.stop()
+
+            status_text.text("Text from PDF extracted...")
+            progress_bar.progress(10)
+
+            # Terms and conditions, classification, dates and discount rate all run in one graph
+            status_text.text("Gathering Terms and Conditions and running lease classification...")
+            progress_bar.progress(20)
+
+            result = dict(state_input)
+            with span('graph') as stage, profile_stage("graph"):
+                for step, update in enumerate(lease_app_instance.stream(state_input, stream_mode="updates"), start=1):
+                    for node, values in update.items():
+                        result.update(values)
+                        status_text.text(f"Finished {node.replace('_', ' ')}...")
+                    progress_bar.progress(min(20 + step * 10, 55))
+            timings['graph'] = stage['seconds']
+            st.session_state['result'] = result
+
+            # Store effective commencement date
+            if early_possession and actual_commencement_date:
+                st.session_state['effective_commencement_date'] = actual_commencement_date
+            else:
+                st.session_state['effective_commencement_date'] = result["dates"]["commencement_date"]
+
+            status_text.text("Building Worksheets...")
+            progress_bar.progress(60)
+
+            # Store debt information
+            st.session_state['has_debt_processed'] = has_debt
+            if has_debt:
+                st.session_state['debt_data_processed'] = {
+                    'commencement_date': [debt_commencement],
+                    'end_date': [debt_end],
+                    'measurement_date': [measurement_date],
+                    'discount_rate': [discount_rate]
+                }
+            else:
+                st.session_state['debt_data_processed'] = None
+
+            status_text.text("Building Excel Workbook...")
+            progress_bar.progress(80)
+
+            # IBR table, amortization schedule and workbook
+            with profile_stage("finish_lease"):
+                try:
+                    output = finish_lease(extraction, result, lease_name,
+                                          actual_commencement_date if early_possession else None,
+                                          st.session_state['debt_data_processed'], timings)
+                except LookupError as e:
+                    # The company debt needs Treasury curves the local store does not hold
+                    output = None
+                    st.error(str(e))
+            if output is None:
+                st.stop()
+        write_metrics()
+
+        st.dataframe(output['ibr_df'])
+        st.dataframe(output['debt_df'])
+
+        st.session_state['lease_output'] = output
+        st.session_state['wb'] = output['wb']
         st.session_state['processing_complete'] = True
 
         progress_bar.progress(100)
@@ -212,7 +201,7 @@ if st.button("Start Classification Process", type="primary"):
 # Display results if processing is complete
 if st.session_state['processing_complete'] and st.session_state['result'] is not None:
     result = st.session_state['result']
-    result_2 = st.session_state['result_2']
+    output = st.session_state['lease_output']
     
     # Display commencement date info
     if st.session_state['effective_commencement_date']:
@@ -222,23 +211,18 @@ if st.session_state['processing_complete'] and st.session_state['result'] is not
             st.info(f"Using lease agreement start date as commencement: {result['dates']['commencement_date']}")
 
     st.write("Terms and Conditions:")
-    st.json(result_2['terms_conditions_details'], expanded=True)
+    st.json(result['terms_conditions_details'], expanded=True)
     st.write("Terms and Conditions Options:")   
-    st.json(result_2['terms_conditions_options'], expanded=True)
+    st.json(result['terms_conditions_options'], expanded=True)
     st.write("Terms and Conditions Financials:")
-    st.json(result_2['terms_conditions_financials'], expanded=True)
+    st.json(result['terms_conditions_financials'], expanded=True)
     st.write("Terms and Conditions Additional Terms:")
-    st.json(result_2['terms_conditions_additional'], expanded=True)
+    st.json(result['terms_conditions_additional'], expanded=True)
 
     st.write("Classification:", result["classification"])
     st.write("Discount Rate:", result["discount_rate"])
 
-    # Rebuild IBR dataframe for display
-    ibr_df, debt_df = build_ibr_df(st.session_state['effective_commencement_date'],
-                                result["dates"]["end_date"],
-                                result["discount_rate"], 
-                                has_debt=st.session_state['has_debt_processed'], 
-                                debt_data=st.session_state['debt_data_processed'])
+    ibr_df, debt_df = output['ibr_df'], output['debt_df']
     
     st.write("IBR Calculation:")
     if debt_df is not None:
@@ -261,9 +245,9 @@ if st.session_state['processing_complete'] and st.session_state['result'] is not
         len(result['dates']['payment_dates']),
         result["discount_rate"],
         ((float(result['discount_rate'])/100)/12),
-        float(result_2['terms_conditions_additional']["Initial Direct Costs"]['amount']),
-        -float(result_2['terms_conditions_additional']["Lease Incentives"]['amount']),
-        float(result_2['terms_conditions_options']["Prepaid Rent"]['amount']),
+        float(result['terms_conditions_additional']["Initial Direct Costs"]['amount']),
+        -float(result['terms_conditions_additional']["Lease Incentives"]['amount']),
+        float(result['terms_conditions_options']["Prepaid Rent"]['amount']),
         p_p,
         result['classification']
     ]], columns=[
@@ -284,12 +268,12 @@ if st.session_state['processing_complete'] and st.session_state['result'] is not
     st.write("Risk-free Rates per the U.S. Treasury Department:")
     st.dataframe(result["treasury_df"], use_container_width=True, hide_index=True)
 
-    st.write("Payment Dates:")
-    payments_df = pd.DataFrame(list(result['dates']['payment_dates'].items()), columns=['Date','Lease Payment']).reset_index(names='Period')
-    payments_df['PV Lease Payment'] = (payments_df['Lease Payment'] / ((1 + (result['discount_rate']/100)/12) ** (payments_df['Period']))).round(2)
-    initial_lease_liability = payments_df['PV Lease Payment'].sum()
+    st.write("Amortization Schedule:")
+    payments_df, schedule_summary = output['schedule'], output['schedule_summary']
+    initial_lease_liability = schedule_summary['Initial Lease Liability']
 
-    st.dataframe(payments_df, use_container_width=True)
+    st.dataframe(pd.DataFrame([schedule_summary]).round(2), use_container_width=True, hide_index=True)
+    st.dataframe(payments_df.round(2), use_container_width=True)
 
     # Download button - this should now preserve the displayed content
     if st.session_state['wb'] is not None:
@@ -298,7 +282,8 @@ if st.session_state['processing_complete'] and st.session_state['result'] is not
             output = BytesIO()
             
             # Save the workbook to the BytesIO object
-            st.session_state['wb'].save(output)
+            with profile_stage("save_workbook"):
+                st.session_state['wb'].save(output)
             
             # Get the data before seeking
             excel_data = output.getvalue()
@@ -0,0 +1,206 @@
+"""
+Headless batch processing of a directory of lease PDFs.
+
+    python batch.py LEASE_DIR OUTPUT_DIR --concurrency 4
+
+Leases run concurrently on one event loop through arun_lease(), sharing one
+pooled LLM client, and each is saved as
+OUTPUT_DIR/<lease>_lease_classification.xlsx. Progress is recorded in
+OUTPUT_DIR/manifest.json after every lease, so an interrupted run picks up
+where it left off; leases already marked "ok" are skipped unless --no-resume.
+Stage and node timings, tokens and retries of the run are written to
+OUTPUT_DIR/traces.jsonl and OUTPUT_DIR/metrics.prom (see utils.tracing).
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import time
+import traceback
+
+from pipeline import lease_app, LeaseState, arun_lease
+from utils.rate_limit import get_rate_limiter
+from utils.files import atomic_write
+from utils.tracing import get_tracer, trace, span
+from utils.llm import LLM_MODES, DEFAULT_MODE, DEFAULT_CASSETTE_DIR, DEFAULT_REPLAY_LATENCY, configure_llm
+
+MANIFEST_NAME = "manifest.json"
+TRACES_NAME = "traces.jsonl"
+METRICS_NAME = "metrics.prom"
+
+
+def find_leases(lease_dir):
+    """Every PDF under lease_dir, as paths relative to it, in a stable order."""
+    leases = []
+    for root, _, files in os.walk(lease_dir):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                leases.append(os.path.relpath(os.path.join(root, name), lease_dir))
+    return sorted(leases)
+
+
+def workbook_path(output_dir, lease):
+    return os.path.join(output_dir, f"{os.path.splitext(lease)[0]}_lease_classification.xlsx")
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'leases': {}}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically so an interrupted run never leaves it half written."""
+    with atomic_write(os.path.join(output_dir, MANIFEST_NAME)) as file:
+        json.dump(manifest, file, indent=2, default=str)
+
+
+async def process_lease(lease_dir, output_dir, lease, app, debt_data=None, ocr_workers=None):
+    """Run one lease and save its workbook. Never raises; failures are reported in the manifest entry."""
+    with trace(os.path.splitext(os.path.basename(lease))[0]):
+        return await _process_lease(lease_dir, output_dir, lease, app, debt_data, ocr_workers)
+
+
+async def _process_lease(lease_dir, output_dir, lease, app, debt_data, ocr_workers):
+    started = time.perf_counter()
+    entry = {'started_at': dt.datetime.now().isoformat(timespec='seconds')}
+    try:
+        output = await arun_lease(os.path.join(lease_dir, lease),
+                                  lease_name=os.path.splitext(os.path.basename(lease))[0],
+                                  debt_data=debt_data, app=app, ocr_workers=ocr_workers)
+        path = workbook_path(output_dir, lease)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with span('save') as stage:
+            await asyncio.to_thread(output['wb'].save, path)
+        output['timings']['save'] = stage['seconds']
+
+        result = output['result']
+        entry.update({
+            'status': 'ok',
+            'workbook': os.path.relpath(path, output_dir),
+            'method': output['method'],
+            'extraction_cached': output['extraction_cached'],
+            'classification': result['classification'],
+            'discount_rate': result['discount_rate'],
+            'payments': len(result['dates']['payment_dates']),
+            'initial_lease_liability': output['schedule_summary']['Initial Lease Liability'],
+            'initial_rou_asset': output['schedule_summary']['Initial ROU Asset'],
+            'timings': output['timings'],
+        })
+    except Exception as e:
+        entry.update({
+            'status': 'error',
+            'error': f"{type(e).__name__}: {e}",
+            'traceback': traceback.format_exc(),
+        })
+    entry['seconds'] = time.perf_counter() - started
+    entry['finished_at'] = dt.datetime.now().isoformat(timespec='seconds')
+    return entry
+
+
+def run_batch(lease_dir, output_dir, concurrency=4, resume=True, debt_data=None, ocr_workers=None):
+    """
+    Process every lease PDF under lease_dir with up to `concurrency` leases in flight.
+
+    Returns:
+        dict: The final manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir) if resume else {'leases': {}}
+    leases = find_leases(lease_dir)
+
+    pending = [lease for lease in leases
+               if not (resume
+                       and manifest['leases'].get(lease, {}).get('status') == 'ok'
+                       and os.path.exists(workbook_path(output_dir, lease)))]
+    print(f"{len(leases)} leases found, {len(leases) - len(pending)} already done, {len(pending)} to process")
+
+    if ocr_workers is None:
+        # Share the cores between the leases running at once
+        ocr_workers = max(1, (os.cpu_count() or 1) // max(1, concurrency))
+
+    started = time.perf_counter()
+    asyncio.run(_process_leases(lease_dir, output_dir, pending, manifest, concurrency, debt_data, ocr_workers))
+
+    statuses = [entry.get('status') for entry in manifest['leases'].values()]
+    manifest['summary'] = {
+        'leases': len(leases),
+        'ok': statuses.count('ok'),
+        'error': statuses.count('error'),
+        'concurrency': concurrency,
+        'last_run_seconds': time.perf_counter() - started,
+        'last_run_finished_at': dt.datetime.now().isoformat(timespec='seconds'),
+        # Calls, 429 retries and time spent queued behind the LLM rate limiter
+        'rate_limiter': get_rate_limiter().stats(),
+    }
+    save_manifest(output_dir, manifest)
+
+    # Per-stage and per-node spans of this run, and their totals for Prometheus
+    tracer = get_tracer()
+    tracer.export_jsonl(os.path.join(output_dir, TRACES_NAME))
+    tracer.write_prometheus(os.path.join(output_dir, METRICS_NAME))
+    return manifest
+
+
+async def _process_leases(lease_dir, output_dir, pending, manifest, concurrency, debt_data, ocr_workers):
+    """Run the pending leases on one event loop, at most `concurrency` at a time."""
+    app = lease_app(LeaseState=LeaseState, use_async=True)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(lease):
+        async with semaphore:
+            return lease, await process_lease(lease_dir, output_dir, lease, app, debt_data, ocr_workers)
+
+    tasks = [asyncio.create_task(run_one(lease)) for lease in pending]
+    for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+        lease, entry = await task
+        # Only the event loop thread touches the manifest, so no lock is needed
+        manifest['leases'][lease] = entry
+        save_manifest(output_dir, manifest)
+        print(f"[{done}/{len(pending)}] {lease}: {entry['status']} in {entry['seconds']:.1f}s"
+              + (f" ({entry['error']})" if entry['status'] == 'error' else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a directory of lease PDFs and build a workbook for each.")
+    parser.add_argument("lease_dir", help="Directory searched recursively for lease PDFs")
+    parser.add_argument("output_dir", help="Directory for the workbooks and manifest.json")
+    parser.add_argument("--concurrency", type=int, default=4, help="Number of leases processed at once")
+    parser.add_argument("--ocr-workers", type=int, default=None, help="OCR processes per lease (default: cores / concurrency)")
+    parser.add_argument("--no-resume", action="store_true", help="Reprocess leases already marked ok in the manifest")
+    parser.add_argument("--debt-start", type=dt.date.fromisoformat, help="Company debt commencement date (YYYY-MM-DD)")
+    parser.add_argument("--debt-end", type=dt.date.fromisoformat, help="Company debt maturity date (YYYY-MM-DD)")
+    parser.add_argument("--debt-rate", type=float, help="Company debt interest rate in percent")
+    parser.add_argument("--llm-mode", choices=LLM_MODES, default=DEFAULT_MODE,
+                        help="live calls OpenAI, record also saves cassettes, replay runs offline from cassettes")
+    parser.add_argument("--cassette-dir", default=DEFAULT_CASSETTE_DIR, help="Where cassettes are recorded and replayed")
+    parser.add_argument("--replay-latency", default=DEFAULT_REPLAY_LATENCY,
+                        help="Seconds each replayed call takes, or 'recorded' to reuse the recorded latency")
+    parser.add_argument("--metrics-port", type=int, help="Also serve Prometheus metrics on this port while running")
+    args = parser.parse_args()
+    if args.metrics_port:
+        get_tracer().serve_prometheus(args.metrics_port)
+    configure_llm(args.llm_mode, args.cassette_dir, args.replay_latency)
+
+    debt_data = None
+    if args.debt_rate is not None:
+        if args.debt_start is None or args.debt_end is None:
+            parser.error("--debt-rate requires --debt-start and --debt-end")
+        debt_data = {
+            'commencement_date': [args.debt_start],
+            'end_date': [args.debt_end],
+            'measurement_date': [args.debt_start],
+            'discount_rate': [args.debt_rate],
+        }
+
+    manifest = run_batch(args.lease_dir, args.output_dir, concurrency=args.concurrency,
+                         resume=not args.no_resume, debt_data=debt_data, ocr_workers=args.ocr_workers)
+    summary = manifest['summary']
+    print(f"Done: {summary['ok']} ok, {summary['error']} failed, {summary['leases']} total")
+
+
+if __name__ == "__main__":
+    main()
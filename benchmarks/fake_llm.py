@@ -0,0 +1,92 @@
+"""
+Deterministic stand-in for the chat model, answering every node prompt from a
+synthetic lease spec (see synthetic_lease.generate_lease).
+
+Install it with utils.llm.configure_llm(llm=FakeLLM(spec)). Like ReplayLLM it
+skips the response cache and the rate limiter, so only pipeline code is timed.
+"""
+import asyncio
+import json
+import time
+
+from langchain.schema import AIMessage
+
+from utils.llm import MODEL_NAME, TEMPERATURE, MAX_TOKENS
+
+
+def _entry(value, **extra):
+    return {'value': value, 'proof': "synthetic lease", 'section': "1", **extra}
+
+
+class FakeLLM:
+    cacheable = False
+    rate_limited = False
+
+    def __init__(self, spec, latency=0.0):
+        self.spec = spec
+        self.latency = latency
+        self.model_name = MODEL_NAME
+        self.temperature = TEMPERATURE
+        self.max_tokens = MAX_TOKENS
+        self.calls = 0
+
+    def dates(self):
+        return {key: self.spec[key] for key in ('start_date', 'end_date', 'commencement_date', 'execution_date')} \
+            | {'rent_rules': self.spec['rent_rules']}
+
+    def respond(self, prompt):
+        """Pick the answer by the instructions that identify each node's prompt."""
+        spec = self.spec
+        if 'Respond with ONLY one word' in prompt:
+            return spec['classification']
+        if 'Provide ONLY the following keys' in prompt:
+            return json.dumps(self.dates())
+        if "'rent_rules'" in prompt:
+            return json.dumps(self.dates())
+        if 'DISCOUNT RATE' in prompt:
+            # No rate in the lease, so discount_rate_node falls back to the Treasury curve
+            return "0"
+        if '"Taxes and Insurance"' in prompt:
+            return json.dumps({
+                "Taxes and Insurance": _entry("proportionate share"),
+                "Brokerage Commissions": _entry("no", amount=0.0, **{'responsible party': "Landlord"}),
+                "Lease Incentives": _entry("yes", amount=spec['square_feet'] * 10.0, description="TI allowance"),
+                "Rent Concessions": _entry("yes" if spec['rent_rules']['abatements'] else "no", amount=0.0, description=""),
+                "Initial Direct Costs": _entry("no", amount=0.0),
+                "Tenant Improvements": _entry("no", amount=0.0, description=""),
+            })
+        if '"Purchase Option"' in prompt:
+            return json.dumps({
+                "Purchase Option": _entry("no"),
+                "Renewal Option": _entry("yes"),
+                "Break Option": _entry("yes"),
+                "Security Deposit": _entry("yes", amount=spec['rent_rules']['base_rent'], returned="yes", applied="no"),
+                "Prepaid Rent": _entry("no", amount=0.0),
+            })
+        if '"Payment Due Date"' in prompt:
+            return json.dumps({
+                "Payment Due Date": _entry("first day of each month"),
+                "Rent Payments": _entry(f"${spec['rent_rules']['base_rent']:,.2f} per month"),
+                "Rent Escalations": _entry(spec['escalation']),
+                "Percentage Rent": _entry("no", amount=0),
+            })
+        if '"Address"' in prompt:
+            return json.dumps({
+                "Address": _entry(spec['address']),
+                "Lessee": _entry(spec['lessee']),
+                "Lessor": _entry(spec['lessor']),
+                "Premise Description": _entry(f"{spec['square_feet']:,} rentable square feet"),
+            })
+        raise ValueError(f"FakeLLM does not recognise the prompt: {prompt[:200]!r}")
+
+    def invoke(self, messages):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return AIMessage(content=self.respond(messages[-1].content))
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return AIMessage(content=self.respond(messages[-1].content))
@@ -0,0 +1,169 @@
+"""
+Local stub of the OpenAI chat completions API for exercising utils.rate_limit offline.
+
+    python -m benchmarks.rate_limit_stub
+
+StubServer answers POST /v1/chat/completions from a script of responses: a 429
+carrying retry-after-ms or Retry-After, or a normal completion once the script
+runs out. The checks point a real ChatOpenAI client at it (max_retries=0, as
+utils.llm builds it) and assert that limited_invoke/alimited_invoke wait out
+the Retry-After, retry, halve the limiter's rate, and that the queueing delay
+shows up in get_rate_limiter().stats(). Exits with status 1 if a check fails.
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain.schema import HumanMessage
+
+from utils.llm import MODEL_NAME, MAX_TOKENS
+from utils.rate_limit import get_rate_limiter, limited_invoke, alimited_invoke, RATE_SCALE_RECOVERY
+
+RATE_LIMIT_BODY = {"error": {"message": "Rate limit reached for requests", "type": "requests",
+                             "code": "rate_limit_exceeded"}}
+
+
+class StubServer:
+    """
+    Chat completions stub on 127.0.0.1, served from a daemon thread.
+
+    Responses are taken from `script` in order, each a (status, headers) pair;
+    when it is empty every request succeeds. Arrival times of all requests are
+    kept in `requests` (time.monotonic()).
+    """
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, headers = stub._next()
+                body = json.dumps(RATE_LIMIT_BODY if status == 429 else stub.completion()).encode('utf-8')
+                self.send_response(status)
+                for name, value in {**headers, "Content-Type": "application/json",
+                                    "Content-Length": str(len(body))}.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def _next(self):
+        with self._lock:
+            self.requests.append(time.monotonic())
+            return self.script.pop(0) if self.script else (200, {})
+
+    def push(self, *responses):
+        """Append (status, headers) responses to the script."""
+        with self._lock:
+            self.script.extend(responses)
+
+    @staticmethod
+    def completion():
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()), "model": MODEL_NAME,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "OPERATING"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 1, "total_tokens": 13},
+        }
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def stub_llm(stub):
+    """ChatOpenAI pointed at the stub, retrying nothing itself like utils.llm.build_live_llm."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=MODEL_NAME, max_tokens=MAX_TOKENS, openai_api_key="stub", base_url=stub.base_url,
+                      max_retries=0)
+
+
+def _check(condition, message):
+    print(("ok    " if condition else "FAIL  ") + message)
+    return condition
+
+
+def run_checks():
+    """Run the rate limit checks against a fresh stub. Returns True when all of them pass."""
+    stub = StubServer()
+    llm = stub_llm(stub)
+    limiter = get_rate_limiter()
+    messages = [HumanMessage(content="Classify this lease.")]
+    results = []
+    try:
+        # 1. retry-after-ms: the call waits it out, retries once and the rate is halved
+        stub.push((429, {"retry-after-ms": "400"}))
+        before, scale = limiter.stats(), limiter.scale
+        started = time.monotonic()
+        response = limited_invoke(llm, messages, messages[0].content)
+        after = limiter.stats()
+        results += [
+            _check(response.content == "OPERATING", "limited_invoke returns the completion after a 429"),
+            _check(len(stub.requests) == 2, f"one retry after retry-after-ms (requests: {len(stub.requests)})"),
+            _check(stub.requests[1] - stub.requests[0] >= 0.4,
+                   f"retry sent after retry-after-ms=400 ({stub.requests[1] - stub.requests[0]:.2f}s)"),
+            _check(time.monotonic() - started >= 0.4, "the call waited for the retry"),
+            _check(after['rate_limits'] - before['rate_limits'] == 1 and after['retries'] - before['retries'] == 1,
+                   "the 429 is counted in rate_limits and retries"),
+            _check(abs(after['rate_scale'] - (scale / 2 + RATE_SCALE_RECOVERY)) < 1e-9,
+                   f"rate halved by the 429, then one success of recovery (rate_scale {after['rate_scale']:.3f})"),
+            _check(after['queue_seconds'] - before['queue_seconds'] >= 0.4
+                   and after['max_queue_seconds'] >= 0.4 and after['throttled'] > before['throttled'],
+                   f"queueing delay reported by get_rate_limiter().stats() ({after['queue_seconds']:.2f}s queued)"),
+        ]
+
+        # 2. Retry-After in seconds, under concurrent async callers: every caller is paused
+        stub.requests.clear()
+        stub.push((429, {"Retry-After": "1"}))
+        before, scale = limiter.stats(), limiter.scale
+
+        async def concurrent():
+            first = asyncio.create_task(alimited_invoke(llm, messages, messages[0].content))
+            await asyncio.sleep(0.2)
+            # Sent while the pause from the 429 is in force
+            rest = [alimited_invoke(llm, messages, messages[0].content) for _ in range(3)]
+            return await asyncio.gather(first, *rest)
+
+        started = time.monotonic()
+        responses = asyncio.run(concurrent())
+        elapsed = time.monotonic() - started
+        after = limiter.stats()
+        results += [
+            _check(all(response.content == "OPERATING" for response in responses),
+                   "alimited_invoke callers all get completions"),
+            _check(len(stub.requests) == 5, f"only the rate limited call is retried (requests: {len(stub.requests)})"),
+            _check(min(stub.requests[1:]) - stub.requests[0] >= 1.0,
+                   f"no request reaches the server during Retry-After: 1 ({min(stub.requests[1:]) - stub.requests[0]:.2f}s)"),
+            _check(elapsed >= 1.0, f"the batch took the pause ({elapsed:.2f}s)"),
+            _check(after['rate_scale'] < scale, f"rate reduced again (rate_scale {scale:.3f} -> {after['rate_scale']:.3f})"),
+            _check(after['throttled'] - before['throttled'] >= 4,
+                   f"every caller queued behind the pause (throttled +{after['throttled'] - before['throttled']})"),
+        ]
+    finally:
+        stub.close()
+    print(f"\nrate limiter stats: {limiter.stats()}")
+    return all(results)
+
+
+def main():
+    if not run_checks():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
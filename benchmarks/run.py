@@ -0,0 +1,282 @@
+"""
+End-to-end benchmarks on synthetic leases, fully offline.
+
+    python -m benchmarks.run                      # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline    # run and store the results as the new baseline
+    python -m benchmarks.run --scenario standard_annual --repeat 5 --output results.json
+
+Each scenario generates a lease PDF (see synthetic_lease.py) and times every stage
+separately: extract_text_from_pdf, extract_pages_from_pdf, build_document_index,
+each graph node answered by FakeLLM, calculate_discount_rate against a yield curve
+store loaded from local Treasury CSVs, build_ibr_df, amortization_schedule,
+create_workbook and saving the workbook. The whole graph is timed as well. Stage times are the
+fastest of --repeat runs; a stage regresses when it is more than --tolerance slower
+than the baseline and by more than NOISE_FLOOR_SECONDS. Exits with status 1 on a regression.
+
+Every scenario is required: one that is skipped (scanned_mixed needs tesseract for its
+OCR stages) or has no timings in the baseline also exits with status 1, so a run never
+passes without covering OCR. --allow-skip accepts that, e.g. on a machine without tesseract.
+"""
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytesseract
+
+import utils.ibr as ibr
+import utils.retrieval as retrieval
+import utils.yield_curve as yield_curve
+from utils.llm import configure_llm
+from utils.pdf_reading import extract_text_from_pdf, extract_pages_from_pdf, pages_to_text
+from utils.doc_index import build_document_index
+from nodes import classification_node, dates_node, discount_rate_node
+from nodes_2 import lease_details_node, lease_options_node, lease_financials_node, lease_additional_terms_node
+from pipeline import lease_app, LeaseState, build_lease_workbook, lease_schedule
+
+from benchmarks.synthetic_lease import generate_lease, write_treasury_csvs
+from benchmarks.fake_llm import FakeLLM
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_TOLERANCE = 0.3
+NOISE_FLOOR_SECONDS = 0.005
+
+SCENARIOS = {
+    'short_flat': dict(pages=5, scanned_fraction=0.0, term_months=36, escalation='flat'),
+    'standard_annual': dict(pages=15, scanned_fraction=0.0, term_months=60, escalation='annual'),
+    'stepped_30yr': dict(pages=30, scanned_fraction=0.0, term_months=360, escalation='stepped'),
+    'long_complex': dict(pages=80, scanned_fraction=0.0, term_months=120, escalation='complex'),
+    'scanned_mixed': dict(pages=10, scanned_fraction=0.3, term_months=60, escalation='complex'),
+}
+
+# Nodes in an order that respects the graph's dependencies
+NODES = [
+    ('lease_details_node', lease_details_node),
+    ('lease_options_node', lease_options_node),
+    ('lease_financials_node', lease_financials_node),
+    ('lease_additional_terms_node', lease_additional_terms_node),
+    ('classification_node', classification_node),
+    ('dates_node', dates_node),
+    ('discount_rate_node', discount_rate_node),
+]
+
+
+def ocr_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _timed(timings, stage, function, *args, **kwargs):
+    """Call function with its prints silenced and append its wall time to timings[stage]."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        value = function(*args, **kwargs)
+        timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return value
+
+
+def run_once(lease, timings):
+    """Run every stage once for a generated lease, appending stage times to timings."""
+    spec = lease['spec']
+    configure_llm(llm=FakeLLM(spec))
+    # Each run starts as a new lease would, without a retrieval index already built
+    retrieval._INDEX_CACHE.clear()
+
+    _timed(timings, 'extract_text_from_pdf', extract_text_from_pdf, lease['pdf'], verbose=False, ocr_workers=1)
+    pages = _timed(timings, 'extract_pages_from_pdf', extract_pages_from_pdf, lease['pdf'], verbose=False, ocr_workers=1)
+    state = {'text': pages_to_text(pages), 'doc_index': _timed(timings, 'build_document_index', build_document_index, pages)}
+
+    for name, node in NODES:
+        state.update(_timed(timings, name, node, state))
+
+    commencement_date = state['dates']['commencement_date']
+    payments = len(state['dates']['payment_dates'])
+    rate, _ = _timed(timings, 'calculate_discount_rate', ibr.calculate_discount_rate, commencement_date, payments)
+    ibr_df, debt_df = _timed(timings, 'build_ibr_df', ibr.build_ibr_df, commencement_date,
+                             state['dates']['end_date'], rate)
+    _timed(timings, 'amortization_schedule', lease_schedule, state)
+    wb = _timed(timings, 'create_workbook', build_lease_workbook, state, ibr_df, debt_df, lease_name="synthetic")
+    _timed(timings, 'save_workbook', wb.save, io.BytesIO())
+
+    retrieval._INDEX_CACHE.clear()
+    graph = lease_app(LeaseState=LeaseState)
+    graph_input = {'text': state['text'], 'doc_index': state['doc_index']}
+    _timed(timings, 'graph_total', graph.invoke, graph_input)
+
+    return {
+        'payments': payments,
+        'expected_payments': spec['term_months'],
+        'classification': state['classification'],
+        'discount_rate': float(rate),
+    }
+
+
+def run_scenario(name, params, repeat):
+    lease = generate_lease(**params)
+    if lease['spec']['scanned_pages'] and not ocr_available():
+        return {'params': params, 'skipped': "tesseract is not installed, scanned pages cannot be OCRed"}
+
+    timings = {}
+    for _ in range(repeat):
+        checks = run_once(lease, timings)
+    return {
+        'params': params,
+        'pages': lease['spec']['pages'],
+        'pdf_bytes': len(lease['pdf']),
+        'checks': checks,
+        'stages': {stage: {'min': min(times), 'median': statistics.median(times), 'runs': len(times)}
+                   for stage, times in timings.items()},
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(scenarios=None, repeat=3):
+    """
+    Run the named scenarios (all by default) offline.
+
+    Returns:
+        dict: {'meta': machine and commit details, 'scenarios': {name: stage timings and checks}}
+    """
+    names = scenarios or list(SCENARIOS)
+    results = {
+        'meta': {
+            'created': dt.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+        },
+        'scenarios': {},
+    }
+    with tempfile.TemporaryDirectory() as treasury_dir:
+        store = yield_curve.YieldCurveStore(":memory:", auto_sync=False)
+        csv_pattern = write_treasury_csvs(treasury_dir, range(2019, dt.date.today().year + 1))
+        for year in range(2019, dt.date.today().year + 1):
+            store.load_csv(csv_pattern.format(year=year))
+        previous_store = yield_curve.get_yield_curve_store()
+        yield_curve.configure_yield_curve_store(store=store)
+        try:
+            for name in names:
+                print(f"Running {name}...", flush=True)
+                results['scenarios'][name] = run_scenario(name, SCENARIOS[name], repeat)
+        finally:
+            yield_curve.configure_yield_curve_store(store=previous_store)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the fastest stage times with a baseline.
+
+    Returns:
+        list: One dict per stage present in both, with 'regressed' set where the stage is
+        more than tolerance slower and by more than NOISE_FLOOR_SECONDS
+    """
+    rows = []
+    for name, scenario in results['scenarios'].items():
+        base_stages = baseline.get('scenarios', {}).get(name, {}).get('stages', {})
+        for stage, timing in scenario.get('stages', {}).items():
+            if stage not in base_stages:
+                continue
+            current, previous = timing['min'], base_stages[stage]['min']
+            ratio = current / previous if previous else float('inf')
+            rows.append({
+                'scenario': name, 'stage': stage, 'baseline': previous, 'current': current, 'ratio': ratio,
+                'regressed': ratio > 1 + tolerance and current - previous > NOISE_FLOOR_SECONDS,
+            })
+    return rows
+
+
+def uncovered(results, baseline=None):
+    """
+    Scenarios whose stages the run does not check: skipped here, or missing from the baseline.
+
+    Returns:
+        list: (scenario, reason) pairs
+    """
+    missing = []
+    for name, scenario in results['scenarios'].items():
+        if 'skipped' in scenario:
+            missing.append((name, f"skipped: {scenario['skipped']}"))
+        elif baseline is not None and not baseline.get('scenarios', {}).get(name, {}).get('stages'):
+            reason = baseline.get('scenarios', {}).get(name, {}).get('skipped', "not in the baseline")
+            missing.append((name, f"no baseline timings ({reason}); record one with --update-baseline"))
+    return missing
+
+
+def print_report(results, rows):
+    compared = {(row['scenario'], row['stage']): row for row in rows}
+    for name, scenario in results['scenarios'].items():
+        if 'skipped' in scenario:
+            print(f"\n{name}: skipped ({scenario['skipped']})")
+            continue
+        checks = scenario['checks']
+        print(f"\n{name}: {scenario['pages']} pages, {checks['payments']}/{checks['expected_payments']} payments")
+        for stage, timing in scenario['stages'].items():
+            row = compared.get((name, stage))
+            versus = ""
+            if row:
+                versus = f"  x{row['ratio']:.2f} vs baseline" + ("  REGRESSION" if row['regressed'] else "")
+            print(f"  {stage:<30}{timing['min'] * 1000:>10.1f} ms{versus}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks on synthetic leases.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Scenario to run, repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the fastest is reported")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--allow-skip", action="store_true",
+                        help="Do not fail when a scenario is skipped or has no baseline timings")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scenario, args.repeat)
+
+    rows = []
+    baseline = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        rows = compare(results, baseline, args.tolerance)
+        results['comparison'] = {'baseline': args.baseline, 'tolerance': args.tolerance, 'stages': rows}
+    print_report(results, rows)
+    missing = uncovered(results, baseline)
+
+    for path in filter(None, [args.output, args.baseline if args.update_baseline else None]):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f"\nResults written to {path}")
+
+    for name, reason in missing:
+        print(f"\n{name} is not covered: {reason}")
+    regressions = [row for row in rows if row['regressed']]
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed beyond {args.tolerance:.0%}")
+    if regressions or (missing and not args.allow_skip):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
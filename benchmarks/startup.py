@@ -0,0 +1,108 @@
+"""
+Cold-start import benchmark.
+
+    python -m benchmarks.startup                 # time each target in fresh interpreters
+    python -m benchmarks.startup --top 15        # also list the slowest imports of each target
+    python -m benchmarks.startup --update-baseline
+
+Each target is imported in a new Python process, --repeat times, and the fastest
+run is reported, so results reflect a cold interpreter with a warm disk cache.
+Importing "app" executes the Streamlit script in bare mode, which is the work
+done before the first page renders (the button handler does not run). Results are
+compared with benchmarks/startup_baseline.json like benchmarks.run compares stage times.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, "benchmarks", "startup_baseline.json")
+DEFAULT_TOLERANCE = 0.3
+
+TARGETS = ['app', 'pipeline', 'nodes', 'nodes_2', 'utils.pdf_reading', 'utils.llm', 'batch']
+
+TIMER = "import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+
+
+def _run(module, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", TIMER.format(module=module)]
+    completed = subprocess.run(command, cwd=REPO_DIR, capture_output=True, text=True,
+                               env={**os.environ, "PYTHONWARNINGS": "ignore"})
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    return float(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def slowest_imports(stderr, top):
+    """Top-level packages by cumulative import time, from python -X importtime output."""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if not cumulative.isdigit():
+            continue
+        # The outermost entry of a package carries its full cumulative time
+        root = name.split(".")[0]
+        if not name.startswith(" "):
+            packages[root] = max(packages.get(root, 0), int(cumulative))
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def measure(targets=None, repeat=5, top=0):
+    """
+    Returns:
+        dict: {target: {'min', 'runs', optionally 'slowest_imports': [(package, microseconds)]}}
+    """
+    results = {}
+    for module in targets or TARGETS:
+        runs = [_run(module)[0] for _ in range(repeat)]
+        results[module] = {'min': min(runs), 'runs': runs}
+        if top:
+            results[module]['slowest_imports'] = slowest_imports(_run(module, importtime=True)[1], top)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time cold imports of the app and pipeline modules.")
+    parser.add_argument("--target", action="append", help="Module to import, repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target; the fastest is reported")
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest top-level imports of each target")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results JSON to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    args = parser.parse_args()
+
+    results = measure(args.target, args.repeat, args.top)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+
+    regressions = []
+    for module, result in results.items():
+        versus = ""
+        if module in baseline:
+            ratio = result['min'] / baseline[module]['min']
+            versus = f"  x{ratio:.2f} vs baseline"
+            if ratio > 1 + args.tolerance:
+                regressions.append(module)
+                versus += "  REGRESSION"
+        print(f"{module:<22}{result['min'] * 1000:>9.0f} ms{versus}")
+        for package, microseconds in result.get('slowest_imports', []):
+            print(f"    {package:<26}{microseconds / 1000:>9.0f} ms")
+
+    for path in filter(None, [args.output, args.baseline if args.update_baseline else None]):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if regressions:
+        print(f"\nImport time regressed beyond {args.tolerance:.0%} for: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Synthetic lease PDFs for the benchmarks.
+
+generate_lease() writes a lease with a known answer: the rent rules, dates and
+classification the pipeline should extract, so benchmarks can check results
+as well as time them.
+"""
+import datetime as dt
+import random
+import textwrap
+from typing import Dict, Any, List
+
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+
+ESCALATION_LEVELS = ('flat', 'annual', 'stepped', 'complex')
+
+LINES_PER_PAGE = 58
+CHARS_PER_LINE = 95
+
+TREASURY_COLUMNS = ['1 Mo', '1.5 Mo', '2 Mo', '3 Mo', '4 Mo', '6 Mo', '1 Yr', '2 Yr', '3 Yr', '5 Yr', '7 Yr',
+                    '10 Yr', '20 Yr', '30 Yr']
+TREASURY_MONTHS = [1, 1.5, 2, 3, 4, 6, 12, 24, 36, 60, 84, 120, 240, 360]
+
+FILLER_TOPICS = ['Use', 'Maintenance and Repairs', 'Alterations', 'Assignment and Subletting', 'Indemnification',
+                 'Insurance', 'Casualty', 'Condemnation', 'Quiet Enjoyment', 'Surrender', 'Holding Over', 'Notices',
+                 'Estoppel Certificates', 'Subordination', 'Hazardous Materials', 'Signage', 'Parking', 'Access',
+                 'Compliance with Laws', 'Force Majeure', 'Governing Law', 'Entire Agreement']
+
+
+def _add_months(date: dt.date, months: int) -> dt.date:
+    month = np.datetime64(date.strftime('%Y-%m'), 'M') + months
+    day = min(date.day, ((month + 1).astype('datetime64[D]') - month.astype('datetime64[D]')).astype(int))
+    return (month.astype('datetime64[D]') + (day - 1)).astype(dt.date)
+
+
+def rent_rules_for(level: str, start: dt.date, term_months: int, base_rent: float) -> Dict[str, Any]:
+    """Rent rules in the utils.rent_schedule format for an escalation complexity level."""
+    escalations = []
+    abatements = []
+    if level == 'annual':
+        escalations.append({'type': 'percent', 'value': 3.0, 'effective_date': str(_add_months(start, 12)),
+                            'repeat_every_months': 12})
+    elif level == 'stepped':
+        for year in range(1, term_months // 12 + 1):
+            if year * 12 < term_months:
+                escalations.append({'type': 'amount', 'value': 250.0,
+                                    'effective_date': str(_add_months(start, 12 * year)), 'repeat_every_months': 0})
+    elif level == 'complex':
+        escalations.append({'type': 'percent', 'value': 2.5, 'effective_date': str(_add_months(start, 12)),
+                            'repeat_every_months': 12})
+        if term_months > 36:
+            escalations.append({'type': 'fixed', 'value': round(base_rent * 1.2, 2),
+                                'effective_date': str(_add_months(start, term_months // 2)), 'repeat_every_months': 0})
+        abatements.append({'start_date': str(start), 'end_date': str(_add_months(start, 2) - dt.timedelta(days=1)),
+                           'percent': 100.0})
+        abatements.append({'start_date': str(_add_months(start, 12)),
+                           'end_date': str(_add_months(start, 13) - dt.timedelta(days=1)), 'percent': 50.0})
+    elif level != 'flat':
+        raise ValueError(f"Unknown escalation level {level!r}, expected one of {ESCALATION_LEVELS}")
+
+    return {'base_rent': base_rent, 'frequency': 'monthly', 'payment_day': 1, 'first_payment_date': str(start),
+            'escalations': escalations, 'abatements': abatements}
+
+
+def _rent_paragraphs(rules: Dict[str, Any]) -> List[str]:
+    paragraphs = [f"4.1 Base Rent. Tenant shall pay Landlord monthly base rent of ${rules['base_rent']:,.2f}, "
+                  f"payable in advance on the first day of each month commencing on {rules['first_payment_date']}."]
+    for escalation in rules['escalations']:
+        if escalation['type'] == 'percent':
+            repeat = " and on each anniversary thereafter" if escalation['repeat_every_months'] else ""
+            paragraphs.append(f"4.2 Rent Adjustment. Base rent shall increase by {escalation['value']}% on "
+                              f"{escalation['effective_date']}{repeat}.")
+        elif escalation['type'] == 'amount':
+            paragraphs.append(f"4.2 Rent Adjustment. Effective {escalation['effective_date']} the monthly base rent "
+                              f"shall increase by ${escalation['value']:,.2f}.")
+        else:
+            paragraphs.append(f"4.3 Fair Market Reset. Effective {escalation['effective_date']} the monthly base rent "
+                              f"shall be reset to ${escalation['value']:,.2f}.")
+    for abatement in rules['abatements']:
+        paragraphs.append(f"4.4 Rent Abatement. Base rent shall be abated by {abatement['percent']}% for the period "
+                          f"from {abatement['start_date']} through {abatement['end_date']}.")
+    return paragraphs
+
+
+def lease_text(spec: Dict[str, Any], rng: random.Random) -> List[str]:
+    """Paragraphs of the lease body, before padding to the requested page count."""
+    return [
+        "COMMERCIAL LEASE AGREEMENT",
+        f"This Lease is made and entered into as of {spec['execution_date']} by and between "
+        f"{spec['lessor']} (\"Landlord\") and {spec['lessee']} (\"Tenant\").",
+        "ARTICLE 1 PREMISES",
+        f"1.1 Premises. Landlord leases to Tenant Suite {rng.randint(100, 900)} of the building located at "
+        f"{spec['address']}, containing approximately {spec['square_feet']:,} rentable square feet.",
+        "ARTICLE 2 TERM",
+        f"2.1 Term. The term of this Lease shall commence on {spec['commencement_date']} (the \"Commencement Date\") "
+        f"and expire on {spec['end_date']}, a term of {spec['term_months']} months.",
+        "2.2 Renewal Option. Tenant shall have one option to extend the term for five years at fair market rent.",
+        "ARTICLE 3 SECURITY DEPOSIT",
+        f"3.1 Security Deposit. Upon execution Tenant shall deposit ${spec['rent_rules']['base_rent']:,.2f}, "
+        "to be returned to Tenant within thirty days after the expiration of the term.",
+        "ARTICLE 4 RENT",
+        *_rent_paragraphs(spec['rent_rules']),
+        "ARTICLE 5 TAXES AND OPERATING EXPENSES",
+        "5.1 Taxes and Insurance. Tenant shall pay its proportionate share of real estate taxes and operating "
+        "expenses and shall carry commercial general liability insurance of $1,000,000 per occurrence.",
+        "5.2 Brokers. Each party represents that no broker other than the Landlord's broker, whose commission "
+        "Landlord shall pay, was involved in this Lease.",
+        "5.3 Tenant Improvement Allowance. Landlord shall provide an allowance of $10.00 per rentable square foot.",
+        "ARTICLE 6 DEFAULT",
+        "6.1 Events of Default. If Tenant fails to pay rent within ten days after notice, Landlord may terminate "
+        "this Lease. There is no option to purchase the Premises and title remains with Landlord.",
+    ]
+
+
+def _filler(article: int, topic: str, rng: random.Random) -> List[str]:
+    sentences = [
+        f"Tenant shall comply with all provisions relating to {topic.lower()} set forth herein.",
+        "Landlord shall not unreasonably withhold, condition or delay its consent to any request by Tenant.",
+        "Any failure by either party to insist upon strict performance shall not be deemed a waiver.",
+        "All obligations under this section shall survive the expiration or earlier termination of the term.",
+        "Tenant shall deliver written notice to Landlord at the address set forth in the Notices section.",
+    ]
+    body = " ".join(rng.choice(sentences) for _ in range(rng.randint(6, 12)))
+    return [f"ARTICLE {article} {topic.upper()}", f"{article}.1 {topic}. {body}"]
+
+
+def _layout(paragraphs: List[str]) -> List[List[str]]:
+    """Wrap paragraphs into lines and cut them into pages."""
+    lines = []
+    for paragraph in paragraphs:
+        lines.extend(textwrap.wrap(paragraph, CHARS_PER_LINE) or [""])
+        lines.append("")
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+
+
+def generate_lease(pages: int = 10, scanned_fraction: float = 0.0, term_months: int = 60,
+                   escalation: str = 'annual', seed: int = 0) -> Dict[str, Any]:
+    """
+    Build a synthetic lease PDF.
+
+    Args:
+        pages (int): Target page count; filler articles pad the lease up to it
+        scanned_fraction (float): Share of pages rendered as images with no text layer
+        term_months (int): Lease term in months
+        escalation (str): One of ESCALATION_LEVELS, from flat rent to escalations, a reset and abatements
+        seed (int): Seed for the random parts so the same arguments give the same PDF
+
+    Returns:
+        dict: {'pdf': PDF bytes, 'spec': the values the pipeline should extract}
+    """
+    rng = random.Random(seed)
+    start = dt.date(2021 + rng.randint(0, 3), rng.randint(1, 12), 1)
+    end = _add_months(start, term_months) - dt.timedelta(days=1)
+    spec = {
+        'lessor': "Harbor Point Properties LLC",
+        'lessee': "Synthetic Tenant Inc.",
+        'address': f"{rng.randint(10, 9999)} Market Street, Springfield",
+        'square_feet': rng.randint(2, 40) * 500,
+        'execution_date': str(start - dt.timedelta(days=30)),
+        'start_date': str(start),
+        'commencement_date': str(start),
+        'end_date': str(end),
+        'term_months': term_months,
+        'classification': 'OPERATING',
+        'escalation': escalation,
+    }
+    spec['rent_rules'] = rent_rules_for(escalation, start, term_months, float(rng.randint(20, 200) * 100))
+
+    paragraphs = lease_text(spec, rng)
+    article = 7
+    while len(_layout(paragraphs)) < pages:
+        paragraphs.extend(_filler(article, FILLER_TOPICS[(article - 7) % len(FILLER_TOPICS)], rng))
+        article += 1
+    page_lines = _layout(paragraphs)
+
+    scanned_count = int(round(len(page_lines) * scanned_fraction))
+    step = len(page_lines) / scanned_count if scanned_count else 0
+    scanned = {int(i * step) for i in range(scanned_count)}
+
+    doc = fitz.open()
+    for number, lines in enumerate(page_lines):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((54, 60), "\n".join(lines), fontsize=9.5, fontname="cour")
+        if number in scanned:
+            # Replace the page with a picture of itself so only OCR can read it
+            pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+            doc.delete_page(number)
+            image_page = doc.new_page(pno=number, width=612, height=792)
+            image_page.insert_image(image_page.rect, pixmap=pixmap)
+    spec['pages'] = len(page_lines)
+    spec['scanned_pages'] = sorted(page + 1 for page in scanned)
+
+    pdf = doc.tobytes()
+    doc.close()
+    return {'pdf': pdf, 'spec': spec}
+
+
+def write_treasury_csvs(directory: str, years, seed: int = 0) -> str:
+    """
+    Write a synthetic daily Treasury yield curve CSV per year in the home.treasury.gov layout.
+
+    Returns:
+        str: A utils.yield_curve.TREASURY_CSV_URL pattern pointing at the files
+    """
+    rng = np.random.default_rng(seed)
+    for year in years:
+        dates = pd.bdate_range(f"{year}-01-01", f"{year}-12-31")
+        level = 3.0 + rng.normal(0, 0.1, len(dates)).cumsum() * 0.05
+        curve = {column: np.round(level + 0.9 * np.log1p(months / 12), 2)
+                 for column, months in zip(TREASURY_COLUMNS, TREASURY_MONTHS)}
+        df = pd.DataFrame({'Date': dates.strftime('%m/%d/%Y'), **curve}).iloc[::-1]
+        df.to_csv(f"{directory}/treasury_{year}.csv", index=False)
+    return f"{directory}/treasury_{{year}}.csv"
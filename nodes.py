@@ -1,30 +1,42 @@
 from typing import TypedDict
+import asyncio
 import datetime as dt
-import streamlit as st
 from pandas import DataFrame
 
 from langgraph.graph import StateGraph, END #StateGraph manages info flow between components 
 from langchain.prompts import PromptTemplate #this created consistent instructions
 from langchain.schema import HumanMessage
-from langchain_openai import ChatOpenAI # connected to OpenAI
 
 from utils.dict import parse_llm_response_to_dict, extract_classification
-from utils.ibr import *
+from utils.retrieval import retrieve_context
+from utils.llm import get_llm
+from utils.llm_cache import cached_invoke, acached_invoke
+from utils.tracing import traced_node
+from utils.rent_schedule import normalize_rent_rules, build_payment_schedule
+from utils.ibr import calculate_discount_rate
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.0, max_tokens=4000, openai_api_key=st.secrets["OPENAI_API_KEY"])
+# Query terms used to pick the lease passages each node sends to the LLM, see utils.retrieval
+CLASSIFICATION_QUERY = ["transfer of ownership", "title", "purchase option", "bargain purchase", "lease term",
+                        "economic life", "fair value", "residual value", "guarantee", "specialized", "equipment"]
+DATES_QUERY = ["commencement date", "start date", "expiration date", "termination date", "lease term", "execution",
+               "effective date", "base rent", "monthly rent", "annual rent", "rent schedule", "escalation",
+               "increase", "abatement", "free rent", "payable", "due", "months", "years"]
+DISCOUNT_RATE_QUERY = ["interest rate", "implicit rate", "discount rate", "incremental borrowing rate", "interest",
+                       "percent per annum", "late charge", "purchase price", "fair value", "residual value"]
 
 # Memory for the agent
 class State(TypedDict):
 
     text: str #stores the original input text
+    doc_index: dict #page spans, headings and exhibits of the text, see utils.doc_index
     rent_abatement: dict #details about rent abatement
+    terms_conditions_additional: dict #lease_additional_terms_node output, source of rent_abatement in the combined graph
     classification: str #represents the lease classification result (e.g., "OPERATING", "FINANCE")
     dates: dict #stores a summarized version of the text
     discount_rate: float #stores the discount rate for present value calculations
     treasury_df: DataFrame #stores the treasury data used for discount rate calculations
 
-def classification_node(state: State) -> State:
-    """Classify the lease as OPERATING or FINANCE."""
+def classification_message(state: State) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text"],
         template="""
@@ -46,9 +58,9 @@ def classification_node(state: State) -> State:
         Text to analyze: {text}"""
     )
 
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    raw_response = llm.invoke([message]).content.strip()
-    
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, CLASSIFICATION_QUERY)))
+
+def parse_classification(raw_response: str) -> State:
     # Extract and validate classification
     classification = extract_classification(raw_response)
     
@@ -57,7 +69,120 @@ def classification_node(state: State) -> State:
 
     return {'classification': classification}
 
-def dates_node(state: State) -> State:
+@traced_node("classification_node")
+def classification_node(state: State) -> State:
+    """Classify the lease as OPERATING or FINANCE."""
+    raw_response = cached_invoke(get_llm(), [classification_message(state)]).strip()
+    return parse_classification(raw_response)
+
+@traced_node("classification_node")
+async def aclassification_node(state: State) -> State:
+    """Async classification_node."""
+    raw_response = (await acached_invoke(get_llm(), [classification_message(state)])).strip()
+    return parse_classification(raw_response)
+
+def get_rent_abatement(state: State) -> dict:
+    """Rent concessions passed in directly, or taken from lease_additional_terms_node in the combined graph."""
+    if "rent_abatement" in state:
+        return state["rent_abatement"]
+    return state["terms_conditions_additional"]["Rent Concessions"]
+
+def expand_rent_rules(dates_dict: dict) -> dict:
+    """Generate payment_dates locally from the rent rules the LLM extracted."""
+    rent_rules = normalize_rent_rules(dates_dict.get('rent_rules'))
+    start_date = dates_dict.get('start_date') or dates_dict.get('commencement_date')
+    if rent_rules is None or not start_date or not dates_dict.get('end_date'):
+        return dates_dict.get('payment_dates') or {}
+
+    dates_dict['rent_rules'] = rent_rules
+    try:
+        return build_payment_schedule(rent_rules, start_date, dates_dict['end_date'])
+    except ValueError as e:
+        print(f"Warning: Could not build payment schedule from rent rules: {e}")
+        return dates_dict.get('payment_dates') or {}
+
+# Descriptions and query terms for each dates_node field, used to repair individual fields
+DATE_FIELDS = {
+    'start_date': ("The start date of the lease as a string in the format 'YYYY-MM-DD'.",
+                   ["start date", "term", "commence", "beginning", "effective date"]),
+    'end_date': ("The end date of the lease as a string in the format 'YYYY-MM-DD'.",
+                 ["end date", "expiration date", "expire", "termination date", "term", "months", "years"]),
+    'commencement_date': ("The commencement date of the lease as a string in the format 'YYYY-MM-DD'.",
+                          ["commencement date", "commence", "possession", "delivery", "term"]),
+    'rent_rules': ("The rules that determine the rent payments as a JSON dictionary with keys base_rent (float), "
+                   "frequency, payment_day, first_payment_date, escalations (list of effective_date, type "
+                   "'percent'/'amount'/'fixed', value, repeat_every_months) and abatements (list of start_date, "
+                   "end_date, percent).",
+                   ["base rent", "monthly rent", "annual rent", "rent schedule", "escalation", "increase",
+                    "abatement", "free rent", "payable", "due"]),
+}
+
+def _is_blank(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return value.strip().lower() in ('', 'no information available', 'none', 'null', 'n/a')
+    return False
+
+def missing_date_fields(dates_dict: dict) -> list:
+    """dates_node fields that came back blank or as "No information available"."""
+    missing = [key for key in ('start_date', 'end_date', 'commencement_date') if _is_blank(dates_dict.get(key))]
+    if not dates_dict.get('payment_dates'):
+        missing.append('rent_rules')
+    return missing
+
+def merge_dates(dates_dict: dict, update: dict) -> dict:
+    """Fill blank fields of dates_dict from update without overwriting anything already answered."""
+    merged = dict(dates_dict)
+    for key, value in update.items():
+        if key in ('payment_dates', 'rent_rules'):
+            # Rent rules that did not produce a schedule are replaced, not kept
+            if not merged.get('payment_dates') and value:
+                merged[key] = value
+        elif _is_blank(merged.get(key)) and not _is_blank(value):
+            merged[key] = value
+    return merged
+
+def repair_message(state: State, dates_dict: dict, missing: list, attempt: int = 1) -> HumanMessage:
+    """
+    Minimal follow-up request for only the missing dates_node fields, with only their passages.
+    The attempt number is part of the prompt, so each follow-up has its own LLM cache entry.
+    """
+    prompt = PromptTemplate(
+        input_variables=["attempt", "fields", "known", "text", "rent_abatement"],
+        template="""
+        You are a lease accounting expert. Some details of this lease could not be determined on a first reading.
+        This is follow-up request {attempt}; read the text again carefully.
+
+        Provide ONLY the following keys as a JSON dictionary:
+        {fields}
+
+        Already determined (for reference, do not repeat): {known}
+
+        Return only valid JSON without any additional text or formatting.
+
+        Text to analyze: {text}
+
+        Rent Concessions to consider: {rent_abatement}
+        """
+    )
+
+    query = [term for key in missing for term in DATE_FIELDS[key][1]]
+    known = {key: value for key, value in dates_dict.items()
+             if key in DATE_FIELDS and not _is_blank(value) and key not in missing}
+    return HumanMessage(content=prompt.format(
+        attempt=attempt,
+        fields="\n        ".join(f"- '{key}': {DATE_FIELDS[key][0]}" for key in missing),
+        known=known,
+        text=retrieve_context(state, query, token_budget=4000),
+        rent_abatement=get_rent_abatement(state) if 'rent_rules' in missing else "N/A"
+    ))
+
+def parse_repair(raw_response: str, missing: list) -> dict:
+    repair_dict = parse_llm_response_to_dict(raw_response)
+    return {key: repair_dict.get(key) for key in missing}
+
+def dates_message(state: State) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text", "rent_abatement"],
         template="""
@@ -68,9 +193,22 @@ def dates_node(state: State) -> State:
         - 'end_date': The end date of the lease as a string in the format 'YYYY-MM-DD'.
         - 'commencement_date': The commencement date of the lease as a string in the format 'YYYY-MM-DD'.
         - 'execution_date': lease execution or signing date as a string in the format 'YYYY-MM-DD'.
-        - 'payment_dates': A python dictionary with keys as every payment date (PER MONTH UNLESS OTHERWISE STATED) as strings in the format 'YYYY-MM-DD' and values as the amount of the payment with ANY % INCREASE ALREADY CALCULATED as a float. Please factor in any rent abatement periods and provide the payment amount for each month, even if it is zero based on the rent concessions: {rent_abatement}.
-        
-        IMPORTANT: When calculating payment_dates, carefully consider the rent concessions provided. If there are free rent periods, rent reductions, or other concessions, adjust the monthly payment amounts accordingly. For months with rent abatement, set the payment amount to 0.0.
+        - 'rent_rules': The rules that determine the rent payments, NOT the individual payments, as a JSON dictionary:
+            {{
+                "base_rent": the rent amount of each payment at the start of the lease as a float,
+                "frequency": "monthly", "quarterly", "semiannual" or "annual" (monthly unless otherwise stated),
+                "payment_day": day of the month payments are due as an integer, or null if they fall on the start date's day,
+                "first_payment_date": first rent payment date as 'YYYY-MM-DD', or null if it is the start date,
+                "escalations": [
+                    {{"effective_date": "YYYY-MM-DD", "type": one of "percent", "amount" or "fixed", "value": float, "repeat_every_months": integer or 0}}
+                ],
+                "abatements": [
+                    {{"start_date": "YYYY-MM-DD", "end_date": "YYYY-MM-DD", "percent": percentage of the rent abated as a float, 100.0 for free rent}}
+                ]
+            }}
+          Use "percent" for percentage increases (e.g. 3.0 for 3%), "amount" for fixed dollar increases to the payment, and "fixed" when the lease states the new payment amount. For a recurring increase such as 3% every lease year, give one escalation with the first effective date and "repeat_every_months": 12. Use empty lists when there are no escalations or abatements.
+
+        IMPORTANT: Carefully consider the rent concessions provided. Free rent periods and rent reductions should be given as abatements: {rent_abatement}.
         
         Return only valid JSON without any additional text or formatting.
 
@@ -80,31 +218,65 @@ def dates_node(state: State) -> State:
         """
     )
 
-    max_retries = 2
-    for attempt in range(max_retries):
-        message = HumanMessage(content=prompt.format(
-            text=state["text"], 
-            rent_abatement=state["rent_abatement"]
-        ))
-        raw_response = llm.invoke([message]).content.strip()
-        dates_dict = parse_llm_response_to_dict(raw_response)
-        print(f"dates_dict (attempt {attempt+1}): {dates_dict}")
-
-        # Check for blanks or "No information available"
-        blanks = [
-            dates_dict.get('start_date', '').lower() == 'no information available',
-            dates_dict.get('end_date', '').lower() == 'no information available',
-            dates_dict.get('commencement_date', '').lower() == 'no information available',
-            not dates_dict.get('payment_dates')
-        ]
-        if not any(blanks):
+    return HumanMessage(content=prompt.format(
+        text=retrieve_context(state, DATES_QUERY, token_budget=10000), 
+        rent_abatement=get_rent_abatement(state)
+    ))
+
+def parse_dates(raw_response: str) -> dict:
+    dates_dict = parse_llm_response_to_dict(raw_response)
+    dates_dict['payment_dates'] = expand_rent_rules(dates_dict)
+    return dates_dict
+
+# Ask again only for what is still missing, keeping every field already answered
+MAX_REPAIRS = 2
+
+def dates_requests(state: State):
+    """
+    The dates_node conversation, shared by the sync and async nodes.
+
+    A generator that yields the messages of each LLM call, takes the raw response
+    through send(), and returns the final dates dict: the first request, then up to
+    MAX_REPAIRS follow-ups for the fields still missing.
+    """
+    raw_response = yield [dates_message(state)]
+    dates_dict = parse_dates(raw_response)
+    print(f"dates_dict (attempt 1): {dates_dict}")
+
+    for attempt in range(MAX_REPAIRS):
+        missing = missing_date_fields(dates_dict)
+        if not missing:
             break
+        print(f"Repairing missing fields (attempt {attempt+2}): {missing}")
+        raw_response = yield [repair_message(state, dates_dict, missing, attempt + 1)]
+        dates_dict = merge_dates(dates_dict, parse_repair(raw_response, missing))
+        dates_dict['payment_dates'] = expand_rent_rules(dates_dict)
 
-    return {'dates': dates_dict}
+    return dates_dict
 
+@traced_node("dates_node")
+def dates_node(state: State) -> State:
+    requests = dates_requests(state)
+    messages = next(requests)
+    while True:
+        try:
+            messages = requests.send(cached_invoke(get_llm(), messages).strip())
+        except StopIteration as done:
+            return {'dates': done.value}
 
-def discount_rate_node(state: State) -> State:
-    """Determine the discount rate based on the classification."""
+@traced_node("dates_node")
+async def adates_node(state: State) -> State:
+    """Async dates_node."""
+    requests = dates_requests(state)
+    messages = next(requests)
+    while True:
+        try:
+            messages = requests.send((await acached_invoke(get_llm(), messages)).strip())
+        except StopIteration as done:
+            return {'dates': done.value}
+
+
+def discount_rate_message(state: State) -> HumanMessage:
     if state["classification"] == "FINANCE":
         prompt = PromptTemplate(
             input_variables=["text"],
@@ -125,10 +297,11 @@ def discount_rate_node(state: State) -> State:
             If that rate cannot be readily determined, the lessee should use its incremental borrowing rate, return a 0 if so.
             Please provide the discount rate as a python float representing a percentage (e.g., 5.0 for 5%):\n{text}"""
         )
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    discount_rate = float(llm.invoke([message]).content.strip())
-    print(f"Discount rate from LLM: {discount_rate}")
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, DISCOUNT_RATE_QUERY)))
 
+def resolve_discount_rate(state: State, discount_rate: float) -> State:
+    """Fall back to the Treasury risk-free rate when the lease has no implicit rate."""
+    treasure_df = None
     if discount_rate == 0:
         print(state['dates']['commencement_date'])
         discount_rate, treasure_df = calculate_discount_rate(
@@ -138,13 +311,28 @@ def discount_rate_node(state: State) -> State:
 
     return {'discount_rate': discount_rate, 'treasury_df': treasure_df} 
 
-def app(State):
+@traced_node("discount_rate_node")
+def discount_rate_node(state: State) -> State:
+    """Determine the discount rate based on the classification."""
+    discount_rate = float(cached_invoke(get_llm(), [discount_rate_message(state)]).strip())
+    print(f"Discount rate from LLM: {discount_rate}")
+    return resolve_discount_rate(state, discount_rate)
+
+@traced_node("discount_rate_node")
+async def adiscount_rate_node(state: State) -> State:
+    """Async discount_rate_node; the Treasury lookup runs in a worker thread."""
+    discount_rate = float((await acached_invoke(get_llm(), [discount_rate_message(state)])).strip())
+    print(f"Discount rate from LLM: {discount_rate}")
+    return await asyncio.to_thread(resolve_discount_rate, state, discount_rate)
+
+def app(State, use_async=False):
+    """Compile the classification graph. With use_async the nodes await the LLM and the graph must be run with ainvoke."""
     workflow = StateGraph(State)
 
     # Add nodes to the graph
-    workflow.add_node("classification_node", classification_node)
-    workflow.add_node("dates_node", dates_node)
-    workflow.add_node("discount_rate_node", discount_rate_node)
+    workflow.add_node("classification_node", aclassification_node if use_async else classification_node)
+    workflow.add_node("dates_node", adates_node if use_async else dates_node)
+    workflow.add_node("discount_rate_node", adiscount_rate_node if use_async else discount_rate_node)
 
     workflow.set_entry_point('classification_node')
     workflow.add_edge('classification_node', 'dates_node')
@@ -1,27 +1,43 @@
 from typing import TypedDict
 import datetime as dt
-import streamlit as st
 
-from langgraph.graph import StateGraph, END #StateGraph manages info flow between components 
+from langgraph.graph import StateGraph, START, END #StateGraph manages info flow between components 
 from langchain.prompts import PromptTemplate #this created consistent instructions
 from langchain.schema import HumanMessage
-from langchain_openai import ChatOpenAI # connected to OpenAI
 
-from utils.dict import *
-
-llm = ChatOpenAI(model="gpt-4o", temperature=0.0, max_tokens=4000, openai_api_key=st.secrets["OPENAI_API_KEY"])
+from utils.dict import (extract_lease_details_dict, extract_lease_options_dict, extract_lease_financials_dict,
+                        extract_lease_additional_terms_dict)
+from utils.retrieval import retrieve_context
+from utils.llm import get_llm
+from utils.llm_cache import cached_invoke, acached_invoke
+from utils.tracing import traced_node
+
+# Query terms used to pick the lease passages each node sends to the LLM, see utils.retrieval
+LEASE_DETAILS_QUERY = ["premises", "property", "address", "located at", "landlord", "tenant", "lessor", "lessee",
+                       "by and between", "rentable square feet", "suite", "floor", "building", "legal description"]
+LEASE_OPTIONS_QUERY = ["purchase option", "option to purchase", "right of first refusal", "renewal option",
+                       "option to extend", "extension", "renew", "termination", "terminate", "early termination",
+                       "default", "events of default", "security deposit", "prepaid rent", "advance rent",
+                       "upon execution"]
+LEASE_FINANCIALS_QUERY = ["base rent", "monthly rent", "annual rent", "minimum rent", "rent schedule", "payable",
+                          "due", "first day of each month", "escalation", "increase", "adjustment", "cpi",
+                          "percentage rent", "gross sales", "per square foot"]
+LEASE_ADDITIONAL_TERMS_QUERY = ["taxes", "real estate taxes", "insurance", "proportionate share", "operating expenses",
+                                "common area maintenance", "broker", "brokerage commission", "allowance",
+                                "tenant improvement", "improvement allowance", "incentive", "abatement", "free rent",
+                                "concession", "moving", "relocation", "legal fees", "costs"]
 
 # Memory for the agent
 class State2(TypedDict):
 
     text: str #stores the original input text
+    doc_index: dict #page spans, headings and exhibits of the text, see utils.doc_index
     terms_conditions_details: dict 
     terms_conditions_options: dict
     terms_conditions_financials: dict
     terms_conditions_additional: dict
 
-def lease_details_node(state: State2) -> State2:
-    """Extract the lease terms and conditions details."""
+def lease_details_message(state: State2) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text"],
         template="""
@@ -41,15 +57,26 @@ def lease_details_node(state: State2) -> State2:
         """
     )
 
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    raw_response = llm.invoke([message]).content.strip()
-    
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, LEASE_DETAILS_QUERY)))
+
+def parse_lease_details(raw_response: str) -> State2:
     # Extract and validate lease details
     lease_details = extract_lease_details_dict(raw_response)
-
     return {'terms_conditions_details': lease_details}
 
-def lease_options_node(state: State2) -> State2:
+@traced_node("lease_details_node")
+def lease_details_node(state: State2) -> State2:
+    """Extract the lease terms and conditions details."""
+    raw_response = cached_invoke(get_llm(), [lease_details_message(state)]).strip()
+    return parse_lease_details(raw_response)
+
+@traced_node("lease_details_node")
+async def alease_details_node(state: State2) -> State2:
+    """Async lease_details_node."""
+    raw_response = (await acached_invoke(get_llm(), [lease_details_message(state)])).strip()
+    return parse_lease_details(raw_response)
+
+def lease_options_message(state: State2) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text"],
         template="""
@@ -69,15 +96,25 @@ def lease_options_node(state: State2) -> State2:
         """
     )
 
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    raw_response = llm.invoke([message]).content.strip()
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, LEASE_OPTIONS_QUERY)))
 
+def parse_lease_options(raw_response: str) -> State2:
     # Extract and validate lease options
     options_dict = extract_lease_options_dict(raw_response)
-    
     return {'terms_conditions_options': options_dict}
 
-def lease_financials_node(state: State2) -> State2:
+@traced_node("lease_options_node")
+def lease_options_node(state: State2) -> State2:
+    raw_response = cached_invoke(get_llm(), [lease_options_message(state)]).strip()
+    return parse_lease_options(raw_response)
+
+@traced_node("lease_options_node")
+async def alease_options_node(state: State2) -> State2:
+    """Async lease_options_node."""
+    raw_response = (await acached_invoke(get_llm(), [lease_options_message(state)])).strip()
+    return parse_lease_options(raw_response)
+
+def lease_financials_message(state: State2) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text"],
         template="""
@@ -96,15 +133,25 @@ def lease_financials_node(state: State2) -> State2:
         """
     )
 
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    raw_response = llm.invoke([message]).content.strip()
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, LEASE_FINANCIALS_QUERY)))
 
+def parse_lease_financials(raw_response: str) -> State2:
     # Extract and validate lease financials
     financials_dict = extract_lease_financials_dict(raw_response)
-    
     return {'terms_conditions_financials': financials_dict}
 
-def lease_additional_terms_node(state: State2) -> State2:
+@traced_node("lease_financials_node")
+def lease_financials_node(state: State2) -> State2:
+    raw_response = cached_invoke(get_llm(), [lease_financials_message(state)]).strip()
+    return parse_lease_financials(raw_response)
+
+@traced_node("lease_financials_node")
+async def alease_financials_node(state: State2) -> State2:
+    """Async lease_financials_node."""
+    raw_response = (await acached_invoke(get_llm(), [lease_financials_message(state)])).strip()
+    return parse_lease_financials(raw_response)
+
+def lease_additional_terms_message(state: State2) -> HumanMessage:
     prompt = PromptTemplate(
         input_variables=["text"],
         template="""
@@ -125,28 +172,38 @@ def lease_additional_terms_node(state: State2) -> State2:
         """
     )
 
-    message = HumanMessage(content=prompt.format(text=state["text"]))
-    raw_response = llm.invoke([message]).content.strip()
+    return HumanMessage(content=prompt.format(text=retrieve_context(state, LEASE_ADDITIONAL_TERMS_QUERY)))
 
+def parse_lease_additional_terms(raw_response: str) -> State2:
     # Extract and validate lease additional terms
     additional_terms_dict = extract_lease_additional_terms_dict(raw_response)
-    
     return {'terms_conditions_additional': additional_terms_dict}
 
-def app_2(State2):
+@traced_node("lease_additional_terms_node")
+def lease_additional_terms_node(state: State2) -> State2:
+    raw_response = cached_invoke(get_llm(), [lease_additional_terms_message(state)]).strip()
+    return parse_lease_additional_terms(raw_response)
+
+@traced_node("lease_additional_terms_node")
+async def alease_additional_terms_node(state: State2) -> State2:
+    """Async lease_additional_terms_node."""
+    raw_response = (await acached_invoke(get_llm(), [lease_additional_terms_message(state)])).strip()
+    return parse_lease_additional_terms(raw_response)
+
+def app_2(State2, use_async=False):
+    """Compile the terms and conditions graph. With use_async the nodes await the LLM and the graph must be run with ainvoke."""
     workflow = StateGraph(State2)
 
     # Add nodes to the graph
-    workflow.add_node("lease_details_node", lease_details_node)
-    workflow.add_node("lease_options_node", lease_options_node)
-    workflow.add_node("lease_financials_node", lease_financials_node)
-    workflow.add_node("lease_additional_terms_node", lease_additional_terms_node)
-
-    workflow.set_entry_point('lease_details_node')
-    workflow.add_edge('lease_details_node', 'lease_options_node')
-    workflow.add_edge('lease_options_node', 'lease_financials_node')
-    workflow.add_edge('lease_financials_node', 'lease_additional_terms_node')   
-    workflow.add_edge('lease_additional_terms_node', END)
+    workflow.add_node("lease_details_node", alease_details_node if use_async else lease_details_node)
+    workflow.add_node("lease_options_node", alease_options_node if use_async else lease_options_node)
+    workflow.add_node("lease_financials_node", alease_financials_node if use_async else lease_financials_node)
+    workflow.add_node("lease_additional_terms_node", alease_additional_terms_node if use_async else lease_additional_terms_node)
+
+    # The four extractions are independent, so fan out from the start and join at the end
+    for node in ['lease_details_node', 'lease_options_node', 'lease_financials_node', 'lease_additional_terms_node']:
+        workflow.add_edge(START, node)
+    workflow.add_edge(['lease_details_node', 'lease_options_node', 'lease_financials_node', 'lease_additional_terms_node'], END)
 
     app = workflow.compile()
     return app
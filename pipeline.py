@@ -0,0 +1,207 @@
+import asyncio
+from typing import TypedDict
+from pandas import DataFrame
+
+from langgraph.graph import StateGraph, START, END #StateGraph manages info flow between components
+
+from nodes import (classification_node, dates_node, discount_rate_node,
+                   aclassification_node, adates_node, adiscount_rate_node)
+from nodes_2 import (lease_details_node, lease_options_node, lease_financials_node, lease_additional_terms_node,
+                     alease_details_node, alease_options_node, alease_financials_node, alease_additional_terms_node)
+from utils.pdf_reading import pages_to_text
+from utils.extraction_cache import cached_extract_pages
+from utils.doc_index import build_document_index
+from utils.ibr import build_ibr_df
+from utils.amortization import amortization_schedule
+from utils.excel import create_workbook
+from utils.tracing import trace, span, write_metrics
+
+# Memory for the combined agent, the union of State and State2
+class LeaseState(TypedDict):
+
+    text: str #stores the original input text
+    doc_index: dict #page spans, headings and exhibits of the text, see utils.doc_index
+    terms_conditions_details: dict
+    terms_conditions_options: dict
+    terms_conditions_financials: dict
+    terms_conditions_additional: dict
+    rent_abatement: dict #details about rent abatement
+    classification: str #represents the lease classification result (e.g., "OPERATING", "FINANCE")
+    dates: dict #stores a summarized version of the text
+    discount_rate: float #stores the discount rate for present value calculations
+    treasury_df: DataFrame #stores the treasury data used for discount rate calculations
+
+def lease_app(LeaseState, use_async=False):
+    """
+    One graph for the whole lease, wired only along real data dependencies:
+    dates_node needs the rent concessions from lease_additional_terms_node, and
+    discount_rate_node needs the classification and the dates. Everything else
+    starts immediately, so the critical path is concessions -> dates -> discount rate.
+
+    With use_async the async node variants are used and the graph must be run
+    with ainvoke/astream; concurrent nodes then share one event loop instead of threads.
+    """
+    workflow = StateGraph(LeaseState)
+
+    # Add nodes to the graph
+    workflow.add_node("classification_node", aclassification_node if use_async else classification_node)
+    workflow.add_node("lease_details_node", alease_details_node if use_async else lease_details_node)
+    workflow.add_node("lease_options_node", alease_options_node if use_async else lease_options_node)
+    workflow.add_node("lease_financials_node", alease_financials_node if use_async else lease_financials_node)
+    workflow.add_node("lease_additional_terms_node", alease_additional_terms_node if use_async else lease_additional_terms_node)
+    workflow.add_node("dates_node", adates_node if use_async else dates_node)
+    workflow.add_node("discount_rate_node", adiscount_rate_node if use_async else discount_rate_node)
+
+    for node in ['classification_node', 'lease_details_node', 'lease_options_node',
+                 'lease_financials_node', 'lease_additional_terms_node']:
+        workflow.add_edge(START, node)
+
+    workflow.add_edge('lease_additional_terms_node', 'dates_node')
+    workflow.add_edge(['classification_node', 'dates_node'], 'discount_rate_node')
+    workflow.add_edge(['lease_details_node', 'lease_options_node', 'lease_financials_node', 'discount_rate_node'], END)
+
+    app = workflow.compile()
+    return app
+
+def build_lease_workbook(result, ibr_df, debt_df=None, lease_name=''):
+    """Fill the Excel lease template from a finished lease_app result."""
+    return create_workbook(
+        result['dates']['start_date'],
+        result['dates']['end_date'],
+        len(result['dates']['payment_dates']),
+        result["discount_rate"]/100,
+        result['classification'],
+        [x for x in range(len(result['dates']['payment_dates']))],
+        list(result['dates']['payment_dates'].keys()),
+        list(result['dates']['payment_dates'].values()),
+        result,
+        ibr_df, debt_df,
+        float(result['terms_conditions_additional']["Initial Direct Costs"]['amount']),
+        -float(result['terms_conditions_additional']["Lease Incentives"]['amount']),
+        float(result['terms_conditions_options']["Prepaid Rent"]['amount']),
+        'Beginning',
+        lease_name=lease_name
+    )
+
+def lease_schedule(result):
+    """Amortization schedule and beginning balances from the inputs build_lease_workbook writes to the template."""
+    return amortization_schedule(
+        result["discount_rate"]/100,
+        result['classification'],
+        list(result['dates']['payment_dates'].values()),
+        len(result['dates']['payment_dates']),
+        [x for x in range(len(result['dates']['payment_dates']))],
+        list(result['dates']['payment_dates'].keys()),
+        float(result['terms_conditions_additional']["Initial Direct Costs"]['amount']),
+        -float(result['terms_conditions_additional']["Lease Incentives"]['amount']),
+        float(result['terms_conditions_options']["Prepaid Rent"]['amount']),
+        'Beginning'
+    )
+
+def run_lease(pdf_source, lease_name='', actual_commencement_date=None, debt_data=None, app=None,
+              verbose=False, ocr_workers=None):
+    """
+    Run one lease end to end without the Streamlit UI:
+    text extraction, the combined graph, the IBR table and the Excel workbook.
+
+    Args:
+        pdf_source (str | bytes | file-like): Path to the lease PDF, its bytes or a binary buffer
+        lease_name (str): Name written into the workbook
+        actual_commencement_date: Possession date overriding the lease commencement date, if any
+        debt_data (dict): Company debt columns for build_ibr_df, or None if the company holds no debt
+        app: Compiled lease_app to reuse, built on demand if None
+        verbose (bool): Whether to print extraction progress
+        ocr_workers (int): Worker processes for OCR, None uses every core
+
+    Returns:
+        dict: 'method', 'result', 'ibr_df', 'debt_df', 'schedule', 'schedule_summary' (see
+        lease_schedule), 'wb' and per-stage 'timings' in seconds;
+        the stages and graph nodes are also recorded as spans, see utils.tracing
+    """
+    timings = {}
+    with trace(lease_name), span('lease') as lease_span:
+        with span('extraction') as stage:
+            extraction, state_input = extract_lease(pdf_source, verbose=verbose, ocr_workers=ocr_workers)
+        timings['extraction'] = stage['seconds']
+
+        with span('graph') as stage:
+            if app is None:
+                app = lease_app(LeaseState=LeaseState)
+            result = app.invoke(state_input)
+        timings['graph'] = stage['seconds']
+
+        output = finish_lease(extraction, result, lease_name, actual_commencement_date, debt_data, timings)
+    timings['total'] = lease_span['seconds']
+    write_metrics()
+    return output
+
+async def arun_lease(pdf_source, lease_name='', actual_commencement_date=None, debt_data=None, app=None,
+                     verbose=False, ocr_workers=None):
+    """
+    Async run_lease. The graph is awaited with the async nodes so many leases can
+    share one event loop and one pooled LLM client; extraction and the workbook,
+    which are CPU bound, run in worker threads.
+    """
+    timings = {}
+    with trace(lease_name), span('lease') as lease_span:
+        with span('extraction') as stage:
+            extraction, state_input = await asyncio.to_thread(extract_lease, pdf_source, verbose, ocr_workers)
+        timings['extraction'] = stage['seconds']
+
+        with span('graph') as stage:
+            if app is None:
+                app = lease_app(LeaseState=LeaseState, use_async=True)
+            result = await app.ainvoke(state_input)
+        timings['graph'] = stage['seconds']
+
+        output = await asyncio.to_thread(finish_lease, extraction, result, lease_name, actual_commencement_date,
+                                         debt_data, timings)
+    timings['total'] = lease_span['seconds']
+    write_metrics()
+    return output
+
+def extract_lease(pdf_source, verbose=False, ocr_workers=None, progress_callback=None):
+    """
+    Extract (or load from the cache) a lease and build the graph input state.
+    progress_callback(done, total) is called as scanned pages are OCRed.
+    """
+    extraction = cached_extract_pages(pdf_source, verbose=verbose, ocr_workers=ocr_workers,
+                                      progress_callback=progress_callback)
+    if extraction is None:
+        raise ValueError("No text could be extracted from the PDF")
+    state_input = {
+        "text": pages_to_text(extraction['pages']),
+        "doc_index": build_document_index(extraction['pages']),
+    }
+    return extraction, state_input
+
+def finish_lease(extraction, result, lease_name, actual_commencement_date, debt_data, timings):
+    """Build the IBR table, the amortization schedule and the workbook from a finished graph result."""
+    with span('ibr') as stage:
+        commencement_date = actual_commencement_date or result["dates"]["commencement_date"]
+        ibr_df, debt_df = build_ibr_df(commencement_date,
+                                       result["dates"]["end_date"],
+                                       result["discount_rate"],
+                                       has_debt=debt_data is not None,
+                                       debt_data=debt_data)
+    timings['ibr'] = stage['seconds']
+
+    with span('schedule') as stage:
+        schedule, schedule_summary = lease_schedule(result)
+    timings['schedule'] = stage['seconds']
+
+    with span('workbook') as stage:
+        wb = build_lease_workbook(result, ibr_df, debt_df, lease_name=lease_name)
+    timings['workbook'] = stage['seconds']
+
+    return {
+        'method': extraction['method'],
+        'extraction_cached': extraction['cached'],
+        'result': result,
+        'ibr_df': ibr_df,
+        'debt_df': debt_df,
+        'schedule': schedule,
+        'schedule_summary': schedule_summary,
+        'wb': wb,
+        'timings': timings,
+    }
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import openpyxl
+import pytest
+
+from utils.amortization import amortization_schedule
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', 'utils', 'Lease Template 2.0.xlsx')
+
+# Formulas of the first two schedule rows that template_schedule below transcribes
+TEMPLATE_FORMULAS = {
+    'C17': '=SUM(G24:G963)',
+    'D17': '=IF(SUM(F24:F35)-SUM(E24:E35)<0,0,SUM(F24:F35)-SUM(E24:E35))',
+    'C18': '=C17+C10+C11+C12',
+    'C19': '=SUM(F24:F143)+C18-C17',
+    'D24': '=$C$17',
+    'E24': '=IF($C$13="Beginning",(D24-F24)*$C$9,D24*$C$9)',
+    'G24': '=F24/(1+$C$9)^B24',
+    'H24': '=D24+E24-F24',
+    'I24': '=$C$18',
+    'J24': '=C19-SUM(J25:J500)',
+    'K24': '=IF($C$14="Operating",J24-E24,0)',
+    'L24': '=IF($C$14="Operating",I24-K24,I24-J24)',
+    'M24': '=IF(SUM(F25:F36)-SUM(E25:E36)<0,0,SUM(F25:F36)-SUM(E25:E36))',
+    'Q24': '=J24',
+    'D25': '=H24',
+    'I25': '=L24',
+    'J25': '=IF(F25="",0,IF($C$14="Finance",$I$24/$C$7,$C$19/$C$7))',
+}
+
+
+def test_template_formulas_unchanged():
+    ws = openpyxl.load_workbook(TEMPLATE)['Lease Amortization Schedule']
+    assert {cell: ws[cell].value for cell in TEMPLATE_FORMULAS} == TEMPLATE_FORMULAS
+
+
+def template_schedule(rate, classification, payments, lease_length, periods, idc, incentives, prepaid, timing):
+    """The sheet's formulas evaluated row by row, one variable per column."""
+    C9 = rate / 12
+    n = len(payments)
+    F = list(payments)
+    G = [F[i] / (1 + C9) ** periods[i] for i in range(n)]
+    C17 = sum(G)
+    C18 = C17 + idc + incentives + prepaid
+    C19 = sum(F[:120]) + C18 - C17
+
+    D, E, H = [], [], []
+    for i in range(n):
+        D.append(C17 if i == 0 else H[i - 1])
+        E.append((D[i] - F[i]) * C9 if timing == 'Beginning' else D[i] * C9)
+        H.append(D[i] + E[i] - F[i])
+
+    J = [0.0] + [C18 / lease_length if classification == 'Finance' else C19 / lease_length for _ in range(1, n)]
+    J[0] = C19 - sum(J[1:])
+    I, K, L = [], [], []
+    for i in range(n):
+        I.append(C18 if i == 0 else L[i - 1])
+        K.append(J[i] - E[i] if classification == 'Operating' else 0)
+        L.append(I[i] - K[i] if classification == 'Operating' else I[i] - J[i])
+    M = [max(sum(F[i + 1:i + 13]) - sum(E[i + 1:i + 13]), 0) for i in range(n)]
+    D17 = max(sum(F[:12]) - sum(E[:12]), 0)
+
+    columns = {
+        'Liability Beginning Balance': D, 'Liability Accretion': E, 'Lease Payment': F, 'PV Lease Payment': G,
+        'Liability End Balance': H, 'ROU Beginning Balance': I, 'ROU Amortization / Lease Cost': J,
+        'ROU Asset Reduction': K, 'ROU End Balance': L, 'Current Liability': M,
+        'Non-Current Liability': [H[i] - M[i] for i in range(n)], 'Lease Expense': J,
+    }
+    summary = {'Initial Lease Liability': C17, 'Initial ROU Asset': C18, 'Total Remaining Lease Costs': C19,
+               'Current': D17, 'Non-Current': C17 - D17}
+    return columns, summary
+
+
+@pytest.mark.parametrize('classification', ['Operating', 'Finance'])
+@pytest.mark.parametrize('timing', ['Beginning', 'Ending'])
+@pytest.mark.parametrize('count, incentives', [(68, -84786.0), (150, 0.0)])
+def test_matches_template(classification, timing, count, incentives):
+    rng = np.random.default_rng(count)
+    payments = list(np.round(30000 * 1.03 ** (np.arange(count) // 12) + rng.uniform(0, 500, count), 2))
+    periods = [i + (0 if timing == 'Beginning' else 1) for i in range(count)]
+    args = (0.1112186, classification, payments, count, periods, 12000.0, incentives, 32383.54, timing)
+
+    schedule, summary = amortization_schedule(*args[:3], lease_length=count, period_list=periods,
+                                              initial_direct_costs=12000.0, incentives=incentives,
+                                              prepaid_rent=32383.54, payment_period=timing)
+    columns, expected_summary = template_schedule(*args)
+
+    for name, values in columns.items():
+        np.testing.assert_allclose(schedule[name].to_numpy(), values, rtol=1e-9, atol=1e-6, err_msg=name)
+    assert summary == pytest.approx(expected_summary, rel=1e-9, abs=1e-6)
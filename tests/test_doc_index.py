@@ -0,0 +1,47 @@
+import pytest
+
+from utils.doc_index import _match_heading, build_document_index, cite
+
+
+@pytest.mark.parametrize("line", [
+    "Exhibit A attached hereto.",
+    "Schedule 1 sets forth the Base Rent.",
+    "Section 5 of this Lease provides that Tenant shall pay Additional Rent.",
+    "12 Months following the Commencement Date, Tenant may terminate.",
+    "Article 7 shall survive the expiration of the Term.",
+    "EXHIBIT B hereto describes the Premises.",
+    "Exhibit C. Tenant shall deliver the certificate.",
+    "Section 4. Tenant shall pay the Base Rent monthly.",
+])
+def test_in_body_references_are_not_headings(line):
+    assert _match_heading(line) is None
+
+
+@pytest.mark.parametrize("line, kind, label, title", [
+    ("EXHIBIT A", 'exhibit', "Exhibit A", ""),
+    ("Exhibit B - Legal Description of the Premises", 'exhibit', "Exhibit B", "Legal Description of the Premises"),
+    ("SCHEDULE 1: BASE RENT", 'exhibit', "Schedule 1", "BASE RENT"),
+    ("ARTICLE 4 RENT", 'article', "Article 4", "RENT"),
+    ("Article IV. Term of Lease", 'article', "Article IV", "Term of Lease"),
+    ("Section 5.2 Operating Expenses", 'section', "Section 5.2", "Operating Expenses"),
+    ("Section 5. Base Rent. Tenant shall pay Base Rent monthly.", 'section', "Section 5", "Base Rent"),
+    ("4.1 Base Rent. Tenant shall pay the Base Rent in advance.", 'section', "Section 4.1", "Base Rent"),
+    ("12. Holding Over", 'section', "Section 12", "Holding Over"),
+])
+def test_headings(line, kind, label, title):
+    assert _match_heading(line) == {'kind': kind, 'label': label, 'title': title}
+
+
+def test_in_body_reference_does_not_split_exhibits():
+    pages = [
+        {'page': 1, 'text': "ARTICLE 1 PREMISES\n1.1 Premises. The Premises are shown on\nExhibit A attached hereto.\n"},
+        {'page': 2, 'text': "Schedule 1 sets forth the Base Rent.\nSection 5 of this Lease provides the Term.\n"},
+        {'page': 3, 'text': "EXHIBIT A\nLEGAL DESCRIPTION\nLot 4, Block 2.\n"},
+    ]
+    index = build_document_index(pages)
+
+    assert [exhibit['label'] for exhibit in index['exhibits']] == ["Exhibit A"]
+    assert index['exhibits'][0]['page_start'] == 3
+    assert [heading['label'] for heading in index['headings']] == ["Article 1", "Section 1.1", "Exhibit A"]
+    # Body text on page 2 stays inside section 1.1
+    assert cite(index, index['pages'][1]['start']).startswith("Section 1.1")
@@ -0,0 +1,33 @@
+import utils.extraction_cache as extraction_cache
+from utils.pdf_reading import OCR_DPI, OCR_LANG
+from utils.extraction_cache import ExtractionCache, cached_extract_pages
+
+PDF_BYTES = b"%PDF-1.4 scanned lease"
+
+
+def test_key_covers_ocr_settings():
+    key = ExtractionCache.key(PDF_BYTES)
+    assert ExtractionCache.key(PDF_BYTES, dpi=OCR_DPI, lang=OCR_LANG) == key
+    assert ExtractionCache.key(PDF_BYTES, dpi=OCR_DPI + 100) != key
+    assert ExtractionCache.key(PDF_BYTES, lang=OCR_LANG + '+spa') != key
+
+
+def test_other_ocr_settings_miss_the_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def extract(pdf_bytes, verbose, dpi, lang, timings, **kwargs):
+        calls.append((dpi, lang))
+        return [{'page': 1, 'method': 'OCR', 'text': f"Rent rendered at {dpi} dpi in {lang}"}]
+
+    monkeypatch.setattr(extraction_cache, 'extract_pages_from_pdf', extract)
+    cache = ExtractionCache(str(tmp_path))
+
+    first = cached_extract_pages(PDF_BYTES, cache=cache, verbose=False, dpi=200, lang='eng')
+    again = cached_extract_pages(PDF_BYTES, cache=cache, verbose=False, dpi=200, lang='eng')
+    sharper = cached_extract_pages(PDF_BYTES, cache=cache, verbose=False, dpi=300, lang='eng')
+    spanish = cached_extract_pages(PDF_BYTES, cache=cache, verbose=False, dpi=200, lang='spa')
+
+    assert calls == [(200, 'eng'), (300, 'eng'), (200, 'spa')]
+    assert again['cached'] and again['pages'] == first['pages']
+    assert not sharper['cached'] and sharper['pages'][0]['text'] == "Rent rendered at 300 dpi in eng"
+    assert not spanish['cached']
@@ -0,0 +1,39 @@
+from utils.rent_schedule import normalize_rent_rules, build_payment_schedule
+
+
+def schedule(start_date, end_date, escalations, payment_day=None):
+    rules = normalize_rent_rules({'base_rent': 1000, 'frequency': 'monthly', 'payment_day': payment_day,
+                                  'first_payment_date': start_date, 'escalations': escalations})
+    return build_payment_schedule(rules, start_date, end_date)
+
+
+def test_monthly_escalation_from_month_end_is_clipped():
+    payments = schedule('2024-01-31', '2024-05-31',
+                        [{'type': 'amount', 'value': 10, 'effective_date': '2024-01-31', 'repeat_every_months': 1}])
+    assert payments == {
+        '2024-01-31': 1010.0,
+        '2024-02-29': 1020.0,
+        '2024-03-31': 1030.0,
+        '2024-04-30': 1040.0,
+        '2024-05-31': 1050.0,
+    }
+
+
+def test_leap_day_anniversary_stays_in_february():
+    payments = schedule('2024-02-29', '2027-03-28',
+                        [{'type': 'percent', 'value': 10, 'effective_date': '2025-02-28', 'repeat_every_months': 12}])
+    assert payments['2025-01-29'] == 1000.0
+    assert payments['2025-02-28'] == 1100.0
+    assert payments['2026-02-28'] == 1210.0
+    assert payments['2027-02-28'] == 1331.0
+
+
+def test_leap_day_escalation_repeats_on_february_28():
+    payments = schedule('2024-01-01', '2026-12-01',
+                        [{'type': 'amount', 'value': 100, 'effective_date': '2024-02-29', 'repeat_every_months': 12}],
+                        payment_day=28)
+    assert payments['2024-02-28'] == 1000.0
+    assert payments['2024-03-28'] == 1100.0
+    # The 2025 anniversary is Feb 28, so the Feb 28 payment already carries it
+    assert payments['2025-02-28'] == 1200.0
+    assert payments['2026-02-28'] == 1300.0
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+CLASSIFICATIONS = ('OPERATING', 'FINANCE')
+PAYMENT_TIMINGS = ('Beginning', 'Ending')
+
+# Months ahead whose payments (net of accretion) are the current portion of the liability
+CURRENT_MONTHS = 12
+
+# Payments the template's Total Remaining Lease Costs sums (C19 = SUM(F24:F143) + C18 - C17)
+TEMPLATE_COST_ROWS = 120
+
+
+def _next_months(values, months=CURRENT_MONTHS):
+    """For each period i, the sum of values over periods i+1 .. i+months."""
+    totals = np.concatenate([[0.0], np.cumsum(values)])
+    periods = np.arange(len(values))
+    return totals[np.minimum(periods + 1 + months, len(values))] - totals[periods + 1]
+
+
+def amortization_schedule(discount_rate, classification, payment_list, lease_length=None, period_list=None,
+                          date_list=None, initial_direct_costs=0, incentives=0, prepaid_rent=0,
+                          payment_period='Beginning'):
+    """
+    Full lease amortization schedule, the same figures the 'Lease Amortization Schedule'
+    sheet of Lease Template 2.0.xlsx computes, without Excel.
+
+    Takes the create_workbook inputs and follows the sheet's formulas column for column,
+    so the schedule shown in the app matches the downloaded workbook. The liability
+    unwind (balance + accretion - payment, accretion on the balance after the payment
+    when paid at the beginning of the period) is computed in closed form with cumulative
+    sums. Other rules come from the sheet as they are:
+    - Total Remaining Lease Costs (C19) only sums the first TEMPLATE_COST_ROWS payments.
+    - The first row's ROU amortization / lease cost (J24) is that total less the later rows,
+      for finance leases too.
+    - Finance leases reduce the ROU asset by the amortization (L = I - J); the Asset
+      Reduction column (K) only applies to operating leases and is 0 for finance leases.
+    - Lease Expense (Q) is the ROU amortization / lease cost column (J) for both
+      classifications, so a finance lease's accretion is not part of it.
+
+    Args:
+        discount_rate (float): Annual discount rate as a fraction (0.05 for 5%)
+        classification (str): 'OPERATING' or 'FINANCE', any case
+        payment_list (list): Payment of each period
+        lease_length (float): Lease term in months (default: the number of payments)
+        period_list (list): Discounting period of each payment (default: 0, 1, ... when paid
+            at the beginning of the period, 1, 2, ... at the end)
+        date_list (list): Date of each payment, copied into the schedule
+        initial_direct_costs (float): Added to the ROU asset
+        incentives (float): Added to the ROU asset, negative for incentives received
+        prepaid_rent (float): Added to the ROU asset
+        payment_period (str): 'Beginning' or 'Ending'
+
+    Returns:
+        tuple: (schedule DataFrame with one row per payment, dict of the sheet's 'Beginning
+        Balances': 'Initial Lease Liability', 'Initial ROU Asset', 'Total Remaining Lease
+        Costs', 'Current', 'Non-Current')
+    """
+    classification = classification.upper()
+    if classification not in CLASSIFICATIONS:
+        raise ValueError(f"Unknown lease classification {classification!r}, expected one of {CLASSIFICATIONS}")
+    payment_period = payment_period.title()
+    if payment_period not in PAYMENT_TIMINGS:
+        raise ValueError(f"Unknown payment timing {payment_period!r}, expected one of {PAYMENT_TIMINGS}")
+
+    payments = np.asarray(payment_list, dtype=float)
+    count = len(payments)
+    beginning = payment_period == 'Beginning'
+    rows = np.arange(count)
+    periods = rows + (0 if beginning else 1) if period_list is None else np.asarray(period_list, dtype=float)
+    lease_length = count if lease_length is None else lease_length
+    monthly_rate = discount_rate / 12
+
+    # Lease liability: PV of the payments, then one month of accretion per row
+    pv_payments = payments / (1 + monthly_rate) ** periods
+    liability = pv_payments.sum()
+    growth = (1 + monthly_rate) ** rows
+    paid_before = np.concatenate([[0.0], np.cumsum(payments / growth / (1 + monthly_rate) ** (0 if beginning else 1))[:-1]])
+    liability_start = growth * (liability - paid_before)
+    accretion = (liability_start - payments) * monthly_rate if beginning else liability_start * monthly_rate
+    liability_end = liability_start + accretion - payments
+
+    # ROU asset: straight-line lease cost (operating) or amortization (finance), J24 takes the remainder
+    rou_asset = liability + initial_direct_costs + incentives + prepaid_rent
+    total_cost = payments[:TEMPLATE_COST_ROWS].sum() + rou_asset - liability
+    straight_line = (rou_asset if classification == 'FINANCE' else total_cost) / lease_length
+    cost = np.full(count, straight_line)
+    if count:
+        cost[0] = total_cost - straight_line * (count - 1)
+    if classification == 'OPERATING':
+        asset_reduction = cost - accretion
+        rou_end = rou_asset - np.cumsum(asset_reduction)
+    else:
+        asset_reduction = np.zeros(count)
+        rou_end = rou_asset - np.cumsum(cost)
+    rou_start = np.concatenate([[rou_asset], rou_end[:-1]])
+    lease_expense = cost
+
+    current = np.maximum(_next_months(payments) - _next_months(accretion), 0.0)
+    initial_current = max(payments[:CURRENT_MONTHS].sum() - accretion[:CURRENT_MONTHS].sum(), 0.0)
+
+    schedule = pd.DataFrame({
+        'Period': periods,
+        'Date': list(date_list) if date_list is not None else [None] * count,
+        'Liability Beginning Balance': liability_start,
+        'Liability Accretion': accretion,
+        'Lease Payment': payments,
+        'PV Lease Payment': pv_payments,
+        'Liability End Balance': liability_end,
+        'ROU Beginning Balance': rou_start,
+        'ROU Amortization / Lease Cost': cost,
+        'ROU Asset Reduction': asset_reduction,
+        'ROU End Balance': rou_end,
+        'Current Liability': current,
+        'Non-Current Liability': liability_end - current,
+        'Lease Expense': lease_expense,
+    })
+    summary = {
+        'Initial Lease Liability': liability,
+        'Initial ROU Asset': rou_asset,
+        'Total Remaining Lease Costs': total_cost,
+        'Current': initial_current,
+        'Non-Current': liability - initial_current,
+    }
+    return schedule, summary
+
+
+def aggregate_schedules(schedules):
+    """
+    Sum lease schedules by payment date, e.g. for a portfolio roll-forward.
+
+    Args:
+        schedules (dict): {lease name: schedule from amortization_schedule}
+
+    Returns:
+        DataFrame: One row per date with the amount columns summed and 'Leases' counting
+        the leases with a payment on that date
+    """
+    frames = [schedule.drop(columns='Period').assign(Leases=1) for schedule in schedules.values()]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True).groupby('Date', sort=True).sum(numeric_only=True).reset_index()
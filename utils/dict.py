@@ -2,6 +2,8 @@ import json
 import re
 from typing import Dict, Any, Union
 
+from utils.tracing import count
+
 def extract_classification(response: str) -> str:
     """
     Extract classification from LLM response and ensure it's either OPERATING or FINANCE.
@@ -32,12 +34,14 @@ def extract_classification(response: str) -> str:
     
     # Default fallback - you might want to handle this differently
     print(f"Warning: Could not extract valid classification from: '{response}'")
+    count('parse_failures')
     return "OPERATING" 
 
 def parse_llm_response_to_dict(response: str) -> Dict[str, Any]:
     """
     Parse LLM response and convert to dictionary with error handling.
-    Updated to handle payment_dates as a dictionary.
+    Updated to handle payment_dates as a dictionary and pass rent_rules through
+    for utils.rent_schedule to expand.
     """
     # Try to parse as JSON first
     try:
@@ -55,7 +59,7 @@ def parse_llm_response_to_dict(response: str) -> Dict[str, Any]:
         parsed_dict = json.loads(cleaned_response)
         
         # Validate and process expected keys
-        expected_keys = ['start_date', 'end_date', 'commencement_date', 'execution_date', 'payment_dates']
+        expected_keys = ['start_date', 'end_date', 'commencement_date', 'execution_date', 'payment_dates', 'rent_rules']
         validated_dict = {}
         
         for key in expected_keys:
@@ -93,6 +97,7 @@ def parse_llm_response_to_dict(response: str) -> Dict[str, Any]:
         return validated_dict
         
     except json.JSONDecodeError:
+        count('parse_failures')
         # If JSON parsing fails, try to extract key-value pairs manually
         return extract_dict_from_text(response)
 
@@ -106,7 +111,8 @@ def extract_dict_from_text(text: str) -> Dict[str, Any]:
         'end_date': None,
         'commencement_date': None,
         'execution_date': None,
-        'payment_dates': {}
+        'payment_dates': {},
+        'rent_rules': None
     }
     
     # Regular expressions to find date patterns
@@ -235,6 +241,7 @@ def extract_lease_details_dict(response: str) -> Dict[str, Any]:
        return validated_dict
        
    except json.JSONDecodeError:
+       count('parse_failures')
        print(f"Warning: Could not parse JSON from response: {response[:100]}...")
        # Return empty structure if parsing fails
        return {
@@ -314,6 +321,7 @@ def extract_lease_options_dict(response: str) -> Dict[str, Any]:
         return validated_dict
         
     except json.JSONDecodeError:
+        count('parse_failures')
         print(f"Warning: Could not parse JSON from response: {response[:100]}...")
         # Return empty structure if parsing fails
         return {
@@ -383,6 +391,7 @@ def extract_lease_financials_dict(response: str) -> Dict[str, Any]:
         return validated_dict
         
     except json.JSONDecodeError:
+        count('parse_failures')
         print(f"Warning: Could not parse JSON from response: {response[:100]}...")
         # Return empty structure if parsing fails
         return {
@@ -508,6 +517,7 @@ def extract_lease_additional_terms_dict(response: str) -> Dict[str, Any]:
         return validated_dict
         
     except json.JSONDecodeError:
+        count('parse_failures')
         print(f"Warning: Could not parse JSON from response: {response[:100]}...")
         # Return empty structure if parsing fails
         return {
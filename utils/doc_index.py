@@ -0,0 +1,211 @@
+import hashlib
+import re
+from bisect import bisect_right
+from typing import Dict, Any, List, Optional
+
+# Separator pages_to_text puts after every page; offsets below assume it
+PAGE_SEPARATOR = "\n\n"
+
+# Longest line still treated as a standalone exhibit heading
+MAX_HEADING_LENGTH = 100
+
+# Lowercase words allowed inside a capitalized heading ('Term of Lease')
+MINOR_WORDS = {'a', 'an', 'and', 'as', 'at', 'by', 'for', 'from', 'in', 'of', 'on', 'or', 'the', 'to', 'with'}
+
+ARTICLE_PATTERN = re.compile(r'^\s*ARTICLE\s+([IVXLC]+|\d+)\b[\s.:\-–—]*(.*)$', re.IGNORECASE)
+SECTION_PATTERN = re.compile(r'^\s*(?:SECTION|Section|§)\s*(\d+(?:\.\d+)*[A-Za-z]?)\b[\s.:\-–—]*(.*)$')
+NUMBERED_PATTERN = re.compile(r'^\s*(\d{1,2}(?:\.\d{1,2}){0,3})\.?\s+([A-Z][A-Za-z0-9 ,&/\'\-]{2,60})(?:[.:]|\s*$)')
+TITLE_PATTERN = re.compile(r'([^.:]*)[.:]?(.*)', re.DOTALL)
+EXHIBIT_PATTERN = re.compile(r'^\s*(EXHIBIT|SCHEDULE|ADDENDUM|RIDER|Exhibit|Schedule|Addendum|Rider)\s+([A-Z0-9][A-Za-z0-9\-]{0,5})\b[\s.:\-–—]*(.*)$')
+
+
+def _split_title(title: str) -> tuple:
+    """Split a line like 'Base Rent. Tenant shall pay...' into the heading phrase and the text after it."""
+    phrase, rest = TITLE_PATTERN.match(title).groups()
+    return phrase.strip(), rest.strip()
+
+
+def _is_title(phrase: str) -> bool:
+    """True for an empty or capitalized heading phrase ('Base Rent', 'TERM OF LEASE'), False for prose."""
+    words = phrase.split()
+    if not words:
+        return True
+    if len(phrase) > 60 or not (words[0][0].isupper() or words[0][0].isdigit()):
+        return False
+    return all(not word[0].isalpha() or word[0].isupper() or word.lower() in MINOR_WORDS for word in words)
+
+
+def _heading_title(title: str, run_in: bool) -> Optional[str]:
+    """
+    Heading title from the text after a heading label, or None when the line is body text.
+
+    The phrase up to the first period or colon must be capitalized. Text after it is only
+    allowed for run-in headings ('5.1 Base Rent. Tenant shall pay...'); exhibit headings
+    stand alone, so 'Exhibit A attached hereto.' is a reference rather than a heading.
+    """
+    phrase, rest = _split_title(title)
+    if not _is_title(phrase) or (rest and (not run_in or not phrase)):
+        return None
+    return phrase[:60]
+
+
+def _match_heading(line: str) -> Optional[Dict[str, str]]:
+    """
+    Classify a single line as an article, section or exhibit heading.
+    Returns None for body text, including in-body references such as
+    'Section 5 of this Lease provides...' or 'Schedule 1 sets forth the Base Rent.'
+    """
+    match = EXHIBIT_PATTERN.match(line)
+    if match and len(line.strip()) <= MAX_HEADING_LENGTH:
+        keyword, label, title = match.groups()
+        title = _heading_title(title, run_in=False)
+        if title is not None:
+            return {'kind': 'exhibit', 'label': f"{keyword.title()} {label}", 'title': title}
+
+    match = ARTICLE_PATTERN.match(line)
+    if match:
+        title = _heading_title(match.group(2), run_in=True)
+        if title is not None:
+            return {'kind': 'article', 'label': f"Article {match.group(1).upper()}", 'title': title}
+
+    match = SECTION_PATTERN.match(line)
+    if match:
+        title = _heading_title(match.group(2), run_in=True)
+        if title is not None:
+            return {'kind': 'section', 'label': f"Section {match.group(1)}", 'title': title}
+
+    match = NUMBERED_PATTERN.match(line)
+    if match:
+        # '12 Months following...' is a sentence; a bare number needs the heading to stand alone
+        number, title = match.group(1), match.group(2).strip()
+        rest = line[match.end():].strip()
+        dotted = '.' in number or line.lstrip()[len(number):].startswith('.')
+        if _is_title(title) and (dotted or not rest):
+            return {'kind': 'section', 'label': f"Section {number}", 'title': title}
+
+    return None
+
+
+def build_document_index(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Build a compact index over the per-page extraction output.
+
+    All offsets are character offsets into pages_to_text(pages), i.e. the same
+    string stored in the graph state as "text", so any node can slice it directly.
+
+    Args:
+        pages (list): Page dicts from extract_pages_from_pdf / cached_extract_pages
+
+    Returns:
+        dict: {
+            'doc_id': hash of the text,
+            'length': total characters,
+            'pages': [{'page', 'method', 'start', 'end'}],
+            'headings': [{'kind', 'label', 'title', 'page', 'start'}],
+            'sections': [{'kind', 'label', 'title', 'page_start', 'page_end', 'start', 'end'}],
+            'exhibits': [{'label', 'title', 'page_start', 'page_end', 'start', 'end'}]
+        }
+    """
+    digest = hashlib.sha256()
+    page_spans = []
+    headings = []
+    offset = 0
+
+    for page in pages:
+        text = page['text']
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        page_spans.append({'page': page['page'], 'method': page.get('method'), 'start': offset, 'end': offset + len(text)})
+
+        line_start = offset
+        for line in text.splitlines(keepends=True):
+            heading = _match_heading(line)
+            if heading:
+                heading['page'] = page['page']
+                heading['start'] = line_start + (len(line) - len(line.lstrip()))
+                headings.append(heading)
+            line_start += len(line)
+
+        offset += len(text) + len(PAGE_SEPARATOR)
+
+    index = {
+        'doc_id': digest.hexdigest(),
+        'length': offset,
+        'pages': page_spans,
+        'headings': headings,
+    }
+
+    # Each heading owns the text up to the next heading
+    sections = []
+    for i, heading in enumerate(headings):
+        end = headings[i + 1]['start'] if i + 1 < len(headings) else offset
+        sections.append({
+            'kind': heading['kind'],
+            'label': heading['label'],
+            'title': heading['title'],
+            'page_start': heading['page'],
+            'page_end': page_for_offset(index, max(end - 1, heading['start'])),
+            'start': heading['start'],
+            'end': end,
+        })
+    index['sections'] = sections
+
+    # Exhibits run until the next exhibit or the end of the document
+    exhibit_headings = [heading for heading in headings if heading['kind'] == 'exhibit']
+    exhibits = []
+    for i, heading in enumerate(exhibit_headings):
+        end = exhibit_headings[i + 1]['start'] if i + 1 < len(exhibit_headings) else offset
+        exhibits.append({
+            'label': heading['label'],
+            'title': heading['title'],
+            'page_start': heading['page'],
+            'page_end': page_for_offset(index, max(end - 1, heading['start'])),
+            'start': heading['start'],
+            'end': end,
+        })
+    index['exhibits'] = exhibits
+
+    return index
+
+
+def page_for_offset(index: Dict[str, Any], offset: int) -> Optional[int]:
+    """Return the 1-based page number containing a character offset."""
+    starts = [span['start'] for span in index['pages']]
+    position = bisect_right(starts, offset) - 1
+    if position < 0:
+        return None
+    return index['pages'][position]['page']
+
+
+def section_for_offset(index: Dict[str, Any], offset: int) -> Optional[Dict[str, Any]]:
+    """Return the section whose heading most recently precedes an offset, or None before the first heading."""
+    starts = [section['start'] for section in index['sections']]
+    position = bisect_right(starts, offset) - 1
+    if position < 0:
+        return None
+    return index['sections'][position]
+
+
+def cite(index: Dict[str, Any], offset: int) -> str:
+    """Human readable location for an offset, e.g. 'Section 4.1 (Base Rent), page 3'."""
+    page = page_for_offset(index, offset)
+    section = section_for_offset(index, offset)
+    if section is None:
+        return f"page {page}"
+    title = f" ({section['title']})" if section['title'] else ""
+    return f"{section['label']}{title}, page {page}"
+
+
+def page_text(text: str, index: Dict[str, Any], page: int) -> str:
+    """Slice the text of a single 1-based page out of the full document text."""
+    span = index['pages'][page - 1]
+    return text[span['start']:span['end']]
+
+
+def pages_text(text: str, index: Dict[str, Any], first_page: int, last_page: int) -> str:
+    """Slice an inclusive range of 1-based pages out of the full document text."""
+    return text[index['pages'][first_page - 1]['start']:index['pages'][last_page - 1]['end']]
+
+
+def section_text(text: str, section: Dict[str, Any]) -> str:
+    """Slice a section or exhibit entry out of the full document text."""
+    return text[section['start']:section['end']]
@@ -1,4 +1,3 @@
-import openpyxl
 import os
 
 
@@ -6,6 +5,8 @@ def create_workbook(measurement_date, end_date, lease_length, discount_rate, cla
                     date_list, payment_list, t_c, ibr_df, debt_df=None, initial_direct_costs=0, incentives=0, prepaid_rent=0, payment_period='Beginning',
                     lease_name=''
                     ):
+    import openpyxl # loaded on first use, it is only needed once a lease has been processed
+
     current_dir = os.path.dirname(__file__)
     excel_path = os.path.join(current_dir, 'Lease Template 2.0.xlsx')
     wb = openpyxl.load_workbook(excel_path)
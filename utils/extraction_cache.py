@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import time
+
+from utils.files import atomic_write
+from utils.pdf_reading import (EXTRACTOR_VERSION, OCR_DPI, OCR_LANG, extract_pages_from_pdf, load_pdf_source,
+                               summarize_methods)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "LEASE_EXTRACTION_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "lease-accounting-analyzer", "extraction")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("LEASE_EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+class ExtractionCache:
+    """
+    Content-addressed on-disk cache of extracted PDF text.
+
+    Entries are JSON files named by the SHA-256 of the PDF bytes, the extractor
+    version and the OCR settings. A file's mtime is refreshed on every hit, and the least recently used
+    entries are evicted once the directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(pdf_bytes, dpi=OCR_DPI, lang=OCR_LANG):
+        digest = hashlib.sha256(pdf_bytes)
+        digest.update(f"extractor-{EXTRACTOR_VERSION}\0dpi-{dpi}\0lang-{lang}".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, entry):
+        """Store entry under key, then evict old entries if the cache is over its size limit."""
+        with atomic_write(self._path(key)) as file:
+            json.dump(entry, file)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+
+def cached_extract_pages(pdf_source, cache=None, verbose=True, dpi=OCR_DPI, lang=OCR_LANG, **kwargs):
+    """
+    Extract per-page text from a PDF, reusing a previous extraction of the same bytes.
+
+    Args:
+        pdf_source (str | bytes | file-like): Path to the PDF file, its bytes or a binary buffer
+        cache (ExtractionCache): Cache to use, defaults to the shared on-disk cache
+        verbose (bool): Whether to print progress information
+        dpi (int): Resolution used when rendering pages for OCR
+        lang (str): Tesseract language(s) for OCR
+        **kwargs: Passed through to extract_pages_from_pdf on a miss
+
+    Returns:
+        dict: Entry with 'key', 'method', 'pages', 'timings' and 'cached', or None if extraction failed
+    """
+    if cache is None:
+        cache = ExtractionCache()
+    path, pdf_bytes = load_pdf_source(pdf_source)
+    if path is not None:
+        if not os.path.exists(path):
+            print(f"Error: File {path} does not exist.")
+            return None
+        # Read once and hand the same bytes to the extractor on a miss
+        with open(path, 'rb') as file:
+            pdf_bytes = file.read()
+
+    key = cache.key(pdf_bytes, dpi, lang)
+    entry = cache.get(key)
+    if entry is not None:
+        if verbose:
+            print(f"Extraction cache hit for {path or 'in-memory PDF'}")
+        entry['cached'] = True
+        return entry
+
+    timings = {}
+    started = time.perf_counter()
+    pages = extract_pages_from_pdf(pdf_bytes, verbose=verbose, dpi=dpi, lang=lang, timings=timings, **kwargs)
+    timings['total'] = time.perf_counter() - started
+
+    method = summarize_methods(pages) if pages else None
+    if method is None:
+        return None
+
+    entry = {
+        'key': key,
+        'extractor_version': EXTRACTOR_VERSION,
+        'method': method,
+        'pages': pages,
+        'timings': timings,
+        'created': time.time(),
+    }
+    if timings.get('ocr_failed'):
+        # Keep the degraded text out of the cache so the next upload retries OCR
+        if verbose:
+            print("OCR did not finish, the extraction is not cached")
+    else:
+        cache.put(key, entry)
+    entry['cached'] = False
+    return entry
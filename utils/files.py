@@ -0,0 +1,26 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, encoding='utf-8'):
+    """
+    Open a text file that replaces path only once the block finishes without an error.
+
+    Writes go to a unique temp file in the same directory, moved over path with
+    os.replace, so readers never see a half-written file and concurrent writers of the
+    same path do not write into each other's data. If the block raises, the temp file is
+    removed and path is left as it was.
+
+    Yields:
+        file: The temp file, open for writing
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as file:
+            yield file
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
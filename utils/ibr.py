@@ -1,118 +1,162 @@
+import numpy as np
 import pandas as pd
 import datetime as dt
 
+from utils.yield_curve import curve_frame, get_yield_curve_store, risk_free_rates
 
 def calculate_discount_rate(date_string, lease_length):
-    commencement_date = dt.datetime.strptime(date_string, '%Y-%m-%d')
-    selected_year = commencement_date.year
-    selected_year_2 = (commencement_date-dt.timedelta(days=365)).year
-    commencement_date = dt.date(commencement_date.year, commencement_date.month, commencement_date.day)
-
-    treasury_url = f"https://home.treasury.gov/resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/{selected_year}/all?type=daily_treasury_yield_curve&field_tdr_date_value={selected_year}&page&_format=csv"
-    df = pd.read_csv(treasury_url)
-
-    treasury_url_2 = f"https://home.treasury.gov/resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/{selected_year_2}/all?type=daily_treasury_yield_curve&field_tdr_date_value={selected_year_2}&page&_format=csv"
-    df2 = pd.read_csv(treasury_url_2)
-
-    df = pd.concat([df, df2])
-
-    df['Date'] = pd.to_datetime(df['Date']).dt.date
-    df = df.rename(columns={
-        '1 Mo': 1,
-        '1.5 Mo': 1.5,
-        '2 Mo': 2,
-        '3 Mo': 3,
-        '4 Mo': 4,
-        '6 Mo': 6,
-        '1 Yr': 12,
-        '2 Yr': 24,
-        '3 Yr': 36,
-        '5 Yr': 60,
-        '7 Yr': 84,
-        '10 Yr': 120,
-        '20 Yr': 240,
-        '30 Yr': 360
-    })
-    
-    # Find the closest date with data
-    final_df = df.loc[(df['Date'] == commencement_date)]
-    while final_df.empty:
-        commencement_date -= pd.Timedelta(days=1)
-        final_df = df.loc[(df['Date'] == commencement_date)]
+    commencement_date = dt.datetime.strptime(date_string, '%Y-%m-%d').date()
+
+    # Most recent curve on or before the commencement date, from the local store
+    store = get_yield_curve_store()
+    if store.auto_sync:
+        store.ensure_synced(commencement_date)
+
+    # Linear between the Treasury tenors, flat beyond 1 and 360 months; whole-month
+    # terms are an index into the curve's precomputed term grid
+    curve_days, curves, rates = store.grid_rates([commencement_date], [lease_length])
+    commencement_date = curve_days[0].astype(dt.date)
+    interpolated_rate = rates[0]
     
     print(f"commencement_date used:", commencement_date)
     print("original lease_length:", lease_length)
+    print(f"Risk-free rate for {lease_length} months: {interpolated_rate}")
     
-    # Available maturity periods (in months)
-    available_periods = [1, 1.5, 2, 3, 4, 6, 12, 24, 36, 60, 84, 120, 240, 360]
-    
-    # Check if exact match exists
-    if lease_length in available_periods:
-        interpolated_rate = final_df[lease_length].values[0]
-        print(f"Exact match found. Using rate: {interpolated_rate}")
+    # Return the interpolated rate and the curve used, with the Treasury column names
+    return interpolated_rate, curve_frame(commencement_date, curves[0])
+
+def debt_spreads(debt_df, method='linear', store=None):
+    """
+    Term-match company debt against the Treasury curve.
+
+    Args:
+        debt_df (DataFrame): One row per instrument with 'measurement_date', 'end_date' and
+            'discount_rate' (interest rate in percent)
+        method (str): Curve interpolation, see utils.yield_curve.INTERPOLATION_METHODS
+        store (YieldCurveStore): Defaults to the process-wide store
+
+    Returns:
+        DataFrame: debt_df with 'Term (Years)', 'Company Risk-Free Rate' (the curve on the
+        measurement date at the instrument's term) and 'Company Risk Premium' added
+
+    Raises:
+        LookupError: If the store has no curve on or before a measurement date
+    """
+    debt_df = debt_df.copy()
+    measurement_dates = pd.to_datetime(debt_df['measurement_date'])
+    debt_df['Term (Years)'] = (pd.to_datetime(debt_df['end_date']) - measurement_dates).dt.days / 365
+    try:
+        rates = risk_free_rates(measurement_dates.values, debt_df['Term (Years)'].values * 12, method, store)
+    except LookupError as e:
+        raise LookupError(f"Cannot term-match the company debt against the Treasury curve: {e}, "
+                          f"or set LEASE_YIELD_CURVE_AUTO_SYNC=1 to download it on lookup") from e
+    debt_df['Company Risk-Free Rate'] = rates['Risk-Free Rate'].values
+    debt_df['Company Risk Premium'] = pd.to_numeric(debt_df['discount_rate'], errors='coerce') - debt_df['Company Risk-Free Rate']
+    return debt_df
+
+def fit_risk_premium(term_months, premiums, weights=None):
+    """
+    Fit a term-dependent company risk premium, premium = a + b * ln(term in years), by
+    weighted least squares. With instruments at a single term the premium is flat.
+
+    Args:
+        term_months (array-like): Instrument terms in months
+        premiums (array-like): Spread of each instrument over the risk-free rate, in percent
+        weights (array-like): E.g. principal outstanding; equal weights by default
+
+    Returns:
+        dict: 'intercept', 'slope' and the 'min_months' / 'max_months' fitted, outside which
+        the premium is held flat
+    """
+    term_months = np.maximum(np.asarray(term_months, dtype=float), 1.0)
+    premiums = np.asarray(premiums, dtype=float)
+    weights = np.ones_like(premiums) if weights is None else np.asarray(weights, dtype=float)
+    valid = ~np.isnan(premiums) & (weights > 0)
+    if not valid.any():
+        raise ValueError("No debt instrument has a usable interest rate to fit a risk premium to")
+    term_months, premiums, weights = term_months[valid], premiums[valid], weights[valid]
+
+    log_terms = np.log(term_months / 12)
+    if np.ptp(log_terms) == 0:
+        intercept, slope = np.average(premiums, weights=weights), 0.0
     else:
-        # Find the two closest periods for interpolation
-        lower_period = None
-        upper_period = None
-        
-        for period in available_periods:
-            if period < lease_length:
-                lower_period = period
-            elif period > lease_length and upper_period is None:
-                upper_period = period
-                break
-        
-        # Handle edge cases
-        if lower_period is None:
-            # Lease length is shorter than shortest available period
-            interpolated_rate = final_df[available_periods[0]].values[0]
-            print(f"Lease length shorter than available data. Using {available_periods[0]} month rate: {interpolated_rate}")
-        elif upper_period is None:
-            # Lease length is longer than longest available period
-            interpolated_rate = final_df[available_periods[-1]].values[0]
-            print(f"Lease length longer than available data. Using {available_periods[-1]} month rate: {interpolated_rate}")
-        else:
-            # Perform linear interpolation
-            lower_rate = final_df[lower_period].values[0]
-            upper_rate = final_df[upper_period].values[0]
-            
-            # Linear interpolation formula: y = y1 + (x - x1) * (y2 - y1) / (x2 - x1)
-            interpolated_rate = lower_rate + (lease_length - lower_period) * (upper_rate - lower_rate) / (upper_period - lower_period)
-            
-            print(f"Interpolating between {lower_period} months ({lower_rate}%) and {upper_period} months ({upper_rate}%)")
-            print(f"Interpolated rate for {lease_length} months: {interpolated_rate}")
-    
-    # Return the interpolated rate and the dataframe with original column names
-    return interpolated_rate, final_df.rename(columns={
-        1: '1 Mo',
-        1.5: '1.5 Mo',
-        2: '2 Mo',
-        3: '3 Mo',
-        4: '4 Mo',
-        6: '6 Mo',
-        12: '1 Yr',
-        24: '2 Yr',
-        36: '3 Yr',
-        60: '5 Yr',
-        84: '7 Yr',
-        120: '10 Yr',
-        240: '20 Yr',
-        360: '30 Yr'
-    })
+        basis = np.column_stack([np.ones_like(log_terms), log_terms]) * np.sqrt(weights)[:, None]
+        (intercept, slope), *_ = np.linalg.lstsq(basis, premiums * np.sqrt(weights), rcond=None)
+    return {'intercept': float(intercept), 'slope': float(slope),
+            'min_months': float(term_months.min()), 'max_months': float(term_months.max())}
+
+def risk_premium_at(fit, term_months):
+    """Evaluate a fit_risk_premium() result at one or many lease terms (months)."""
+    term_months = np.clip(np.asarray(term_months, dtype=float), fit['min_months'], fit['max_months'])
+    return fit['intercept'] + fit['slope'] * np.log(term_months / 12)
+
+def portfolio_ibr(leases_df, debt_df=None, method='linear', store=None):
+    """
+    Incremental borrowing rates for a whole lease book in one vectorized pass.
+
+    Each lease gets the Treasury rate for its term on its commencement date plus the
+    company risk premium fitted to debt_df at that term (0 without debt).
+
+    Args:
+        leases_df (DataFrame): 'commencement_date' and 'end_date' per lease, optionally
+            'term_months' (e.g. the number of payments) to use instead of the dates
+        debt_df (DataFrame): Company debt as for debt_spreads, optionally with 'principal'
+            to weight the fit
+        method (str): Curve interpolation, see utils.yield_curve.INTERPOLATION_METHODS
+        store (YieldCurveStore): Defaults to the process-wide store
 
-def build_ibr_df(commencement_date, end_date, discount_rate, has_debt=False, debt_data=None):
+    Returns:
+        tuple: (DataFrame with leases_df's index and the build_ibr_df columns plus 'Curve Date',
+        fit_risk_premium() result or None)
+    """
+    commencement_dates = pd.to_datetime(leases_df['commencement_date'])
+    end_dates = pd.to_datetime(leases_df['end_date'])
+    term_years = (end_dates - commencement_dates).dt.days / 365
+    if 'term_months' in leases_df:
+        term_months = leases_df['term_months'].to_numpy(dtype=float)
+    else:
+        # Whole months, so lookups hit the store's precomputed term grids
+        term_months = np.round(term_years.to_numpy() * 12)
+
+    rates = risk_free_rates(commencement_dates.values, term_months, method, store)
+    fit = None
+    premium = np.zeros(len(leases_df))
+    if debt_df is not None and len(debt_df):
+        debt_df = debt_spreads(debt_df, method, store)
+        fit = fit_risk_premium(debt_df['Term (Years)'] * 12, debt_df['Company Risk Premium'],
+                               debt_df['principal'] if 'principal' in debt_df else None)
+        premium = risk_premium_at(fit, term_months)
+
+    risk_free = rates['Risk-Free Rate'].to_numpy()
+    ibr_df = pd.DataFrame({
+        'Lease Commencement Date': commencement_dates.values,
+        'Lease End Date': end_dates.values,
+        'Remaining Lease Term (Years)': term_years.to_numpy(),
+        'Lease risk-free rate': risk_free,
+        'Company risk premium': premium,
+        'Lease Incremental Borrowing Rate': risk_free + premium,
+        'Curve Date': rates['Curve Date'].values,
+    }, index=leases_df.index)
+    return ibr_df, fit
+
+def build_ibr_df(commencement_date, end_date, discount_rate, has_debt=False, debt_data=None, store=None):
     """
     Build a DataFrame with the IBR data.
+
+    With debt, each instrument is term-matched against the Treasury curve in store (the
+    process-wide store by default, see debt_spreads) and the lease's risk premium is the
+    fitted premium at the lease term. Without debt no curve is needed.
+
+    Raises:
+        LookupError: With debt, if the store has no curve for a debt measurement date
     """
     # Convert dates to datetime objects
     commencement_date = pd.to_datetime(commencement_date)
     end_date = pd.to_datetime(end_date)
     if has_debt and debt_data:
-        debt_df = pd.DataFrame(debt_data)
-        debt_df['Term (Years)'] = (pd.to_datetime(debt_df['end_date']) - pd.to_datetime(debt_df['measurement_date'])).dt.days / 365
-        debt_df['Company Risk-Free Rate'] = pd.to_numeric('discount_rate', errors='coerce')
-        debt_df['Company Risk Premium'] = debt_df['discount_rate']-debt_df['Company Risk-Free Rate']
-        risk_premium = debt_df['discount_rate']-debt_df['Company Risk-Free Rate']
+        debt_df = debt_spreads(pd.DataFrame(debt_data), store=store)
+        fit = fit_risk_premium(debt_df['Term (Years)'] * 12, debt_df['Company Risk Premium'])
+        risk_premium = float(risk_premium_at(fit, (end_date - commencement_date).days / 365 * 12))
     else:
         risk_premium = 0.0
         debt_df = None
@@ -123,6 +167,6 @@ def build_ibr_df(commencement_date, end_date, discount_rate, has_debt=False, deb
         'Remaining Lease Term (Years)': [(end_date - commencement_date).days / 365],
         'Lease risk-free rate': [discount_rate],
         'Company risk premium': [risk_premium], 
-        'Lease Incremental Borrowing Rate': [discount_rate + 0.0]
+        'Lease Incremental Borrowing Rate': [discount_rate + risk_premium]
     })
     return ibr_df, debt_df
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import time
+
+from utils.llm_cache import LLMCache, render_messages
+from utils.files import atomic_write
+from utils.registry import Shared
+
+MODEL_NAME = "gpt-4o"
+TEMPERATURE = 0.0
+MAX_TOKENS = 4000
+
+# Connection pool shared by every node and every lease in the process
+MAX_CONNECTIONS = int(os.environ.get("LEASE_LLM_MAX_CONNECTIONS", "100"))
+REQUEST_TIMEOUT = float(os.environ.get("LEASE_LLM_TIMEOUT", "300"))
+
+# LEASE_LLM_MODE: "live" calls OpenAI, "record" calls OpenAI and saves every prompt/response
+# as a cassette, "replay" answers only from cassettes and never touches the network
+LLM_MODES = ('live', 'record', 'replay')
+DEFAULT_MODE = os.environ.get("LEASE_LLM_MODE", "live")
+DEFAULT_CASSETTE_DIR = os.environ.get(
+    "LEASE_LLM_CASSETTE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "lease-accounting-analyzer", "cassettes")
+)
+# Seconds each replayed call sleeps, or "recorded" to reproduce the latency measured when recording
+DEFAULT_REPLAY_LATENCY = os.environ.get("LEASE_LLM_REPLAY_LATENCY", "0")
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no cassette was recorded for a prompt."""
+
+
+def cassette_key(llm, messages):
+    """Cassettes are keyed exactly like the response cache: rendered prompt plus model settings."""
+    return LLMCache.key(render_messages(messages), llm.model_name, llm.temperature, llm.max_tokens)
+
+
+class RecordingLLM:
+    """
+    Wraps a live chat model and saves every prompt and response to cassette_dir
+    as <key>.json, together with the latency of the call.
+
+    The response cache is skipped (cacheable = False) so every prompt the pipeline
+    sends reaches the model and ends up on disk.
+    """
+    cacheable = False
+    rate_limited = True
+
+    def __init__(self, llm, cassette_dir=DEFAULT_CASSETTE_DIR):
+        self.llm = llm
+        self.cassette_dir = cassette_dir
+        self.model_name = llm.model_name
+        self.temperature = llm.temperature
+        self.max_tokens = llm.max_tokens
+        os.makedirs(cassette_dir, exist_ok=True)
+
+    def _save(self, messages, response, latency):
+        key = cassette_key(self, messages)
+        cassette = {
+            'key': key,
+            'model': self.model_name,
+            'temperature': self.temperature,
+            'max_tokens': self.max_tokens,
+            'prompt': render_messages(messages),
+            'response': response.content,
+            'latency': round(latency, 3),
+            'recorded': time.time(),
+        }
+        path = os.path.join(self.cassette_dir, f"{key}.json")
+        # Concurrent nodes may record the same prompt at once
+        with atomic_write(path) as file:
+            json.dump(cassette, file, indent=2, ensure_ascii=False)
+
+    def invoke(self, messages):
+        started = time.perf_counter()
+        response = self.llm.invoke(messages)
+        self._save(messages, response, time.perf_counter() - started)
+        return response
+
+    async def ainvoke(self, messages):
+        started = time.perf_counter()
+        response = await self.llm.ainvoke(messages)
+        self._save(messages, response, time.perf_counter() - started)
+        return response
+
+
+class ReplayLLM:
+    """
+    Offline stand-in for ChatOpenAI that answers from cassettes written by RecordingLLM.
+
+    latency is a fixed number of seconds to sleep per call, or "recorded" to sleep
+    for the latency measured when the cassette was recorded. Replayed calls skip
+    the response cache and the rate limiter, so timings are reproducible.
+    """
+    cacheable = False
+    rate_limited = False
+
+    def __init__(self, cassette_dir=DEFAULT_CASSETTE_DIR, latency=DEFAULT_REPLAY_LATENCY,
+                 model_name=MODEL_NAME, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+        self.cassette_dir = cassette_dir
+        self.latency = latency
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+    def _load(self, messages):
+        key = cassette_key(self, messages)
+        path = os.path.join(self.cassette_dir, f"{key}.json")
+        if not os.path.exists(path):
+            raise CassetteMissError(
+                f"No cassette {key} in {self.cassette_dir}; record it with LEASE_LLM_MODE=record "
+                f"(prompt starts: {render_messages(messages)[:200]!r})"
+            )
+        with open(path, 'r', encoding='utf-8') as file:
+            cassette = json.load(file)
+        delay = cassette.get('latency', 0.0) if self.latency == 'recorded' else float(self.latency or 0)
+        from langchain.schema import AIMessage
+        return AIMessage(content=cassette['response']), delay
+
+    def invoke(self, messages):
+        response, delay = self._load(messages)
+        if delay:
+            time.sleep(delay)
+        return response
+
+    async def ainvoke(self, messages):
+        response, delay = self._load(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return response
+
+
+def _api_key():
+    """OPENAI_API_KEY from the environment, falling back to Streamlit secrets when running the app."""
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if api_key:
+        return api_key
+    import streamlit as st
+    return st.secrets["OPENAI_API_KEY"]
+
+
+def build_live_llm():
+    """ChatOpenAI whose sync and async calls each go through one pooled httpx client."""
+    # Imported here so nothing pays for the OpenAI client stack until a live call is needed
+    import httpx
+    from langchain_openai import ChatOpenAI # connected to OpenAI
+
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+    return ChatOpenAI(
+        model=MODEL_NAME,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        openai_api_key=_api_key(),
+        http_client=httpx.Client(limits=limits, timeout=REQUEST_TIMEOUT),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=REQUEST_TIMEOUT),
+        # 429s are retried by utils.rate_limit so every lease backs off together
+        max_retries=0,
+    )
+
+
+def build_llm(mode=DEFAULT_MODE, cassette_dir=DEFAULT_CASSETTE_DIR, replay_latency=DEFAULT_REPLAY_LATENCY):
+    """Build the backend for a mode, see LLM_MODES."""
+    if mode == 'live':
+        return build_live_llm()
+    if mode == 'record':
+        return RecordingLLM(build_live_llm(), cassette_dir)
+    if mode == 'replay':
+        return ReplayLLM(cassette_dir, replay_latency)
+    raise ValueError(f"Unknown LLM mode {mode!r}, expected one of {LLM_MODES}")
+
+
+_llm = Shared(build_llm)
+
+
+def get_llm():
+    """
+    The backend behind every node's cached_invoke call, built on first use
+    from LEASE_LLM_MODE unless configure_llm() picked one.
+
+    Nothing is read from st.secrets until a live client is actually built, so the
+    node modules import, and replay runs, without Streamlit or an API key.
+    """
+    return _llm.get()
+
+
+def configure_llm(mode=DEFAULT_MODE, cassette_dir=DEFAULT_CASSETTE_DIR, replay_latency=DEFAULT_REPLAY_LATENCY, llm=None):
+    """
+    Switch the process-wide backend, e.g. to replay cassettes in a benchmark.
+
+    Args:
+        mode (str): 'live', 'record' or 'replay'
+        cassette_dir (str): Directory cassettes are written to and read from
+        replay_latency (float | str): Seconds per replayed call, or 'recorded'
+        llm: Use this object (anything with invoke/ainvoke and model settings) instead
+
+    Returns:
+        The new backend
+    """
+    return _llm.set(llm if llm is not None else build_llm(mode, cassette_dir, replay_latency))
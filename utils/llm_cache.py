@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils.rate_limit import limited_invoke, alimited_invoke
+from utils.registry import Shared
+from utils.tokens import estimate_tokens
+from utils.tracing import count
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "LEASE_LLM_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "lease-accounting-analyzer", "llm_cache.sqlite3")
+)
+DEFAULT_TTL_SECONDS = float(os.environ.get("LEASE_LLM_CACHE_TTL_DAYS", "30")) * 24 * 60 * 60
+DEFAULT_MAX_BYTES = int(os.environ.get("LEASE_LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# LEASE_LLM_CACHE=0 turns the cache off, LEASE_LLM_CACHE_BYPASS=1 forces fresh answers (still stored)
+CACHE_ENABLED = os.environ.get("LEASE_LLM_CACHE", "1") != "0"
+CACHE_BYPASS = os.environ.get("LEASE_LLM_CACHE_BYPASS", "0") == "1"
+
+
+class LLMCache:
+    """
+    SQLite-backed cache of LLM responses.
+
+    Keys are a SHA-256 of the fully rendered prompt together with the model name,
+    temperature and max_tokens. Entries older than ttl_seconds are ignored and
+    purged, and the least recently used entries are evicted once the stored
+    responses exceed max_bytes. One connection serves every thread, each query
+    under the cache's lock.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(prompt, model, temperature, max_tokens):
+        payload = json.dumps([prompt, model, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """Store a response, then purge expired entries and evict down to max_bytes."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+_cache = Shared(LLMCache)
+
+
+def get_llm_cache():
+    """The cache cached_invoke uses when none is passed: the SQLite file at LEASE_LLM_CACHE_PATH."""
+    return _cache.get()
+
+
+def render_messages(messages):
+    """Flatten chat messages into the exact prompt text used for the cache key."""
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+def record_usage(prompt, response):
+    """Count an LLM call and its tokens on the current tracing span (see utils.tracing)."""
+    usage = getattr(response, 'usage_metadata', None) or {}
+    count('llm_calls')
+    count('input_tokens', usage.get('input_tokens') or estimate_tokens(prompt))
+    count('output_tokens', usage.get('output_tokens') or estimate_tokens(response.content))
+    return response.content
+
+
+def cached_invoke(llm, messages, cache=None, bypass=None):
+    """
+    Drop-in for llm.invoke(messages).content that answers repeated prompts from the cache.
+    Calls that reach the API go through the process-wide rate limiter, see utils.rate_limit.
+
+    Args:
+        llm: LangChain chat model
+        messages (list): Messages to send
+        cache (LLMCache): Cache to use, defaults to the shared process-wide cache
+        bypass (bool): Skip the lookup and store a fresh answer, defaults to LEASE_LLM_CACHE_BYPASS
+
+    Returns:
+        str: Response content
+    """
+    prompt = render_messages(messages)
+    # Cassette backends (utils.llm) bypass the cache so recording and replay see every prompt
+    if not CACHE_ENABLED or not getattr(llm, 'cacheable', True):
+        return record_usage(prompt, limited_invoke(llm, messages, prompt))
+
+    if cache is None:
+        cache = get_llm_cache()
+    if bypass is None:
+        bypass = CACHE_BYPASS
+
+    key = cache.key(prompt, llm.model_name, llm.temperature, llm.max_tokens)
+    if not bypass:
+        response = cache.get(key)
+        if response is not None:
+            count('llm_calls')
+            count('cache_hits')
+            return response
+
+    response = record_usage(prompt, limited_invoke(llm, messages, prompt))
+    cache.put(key, response)
+    return response
+
+
+async def acached_invoke(llm, messages, cache=None, bypass=None):
+    """
+    Async counterpart of cached_invoke, awaiting llm.ainvoke on a miss. The SQLite
+    lookup and write run in a worker thread so they do not block the event loop.
+    """
+    prompt = render_messages(messages)
+    if not CACHE_ENABLED or not getattr(llm, 'cacheable', True):
+        return record_usage(prompt, await alimited_invoke(llm, messages, prompt))
+
+    if cache is None:
+        cache = get_llm_cache()
+    if bypass is None:
+        bypass = CACHE_BYPASS
+
+    key = cache.key(prompt, llm.model_name, llm.temperature, llm.max_tokens)
+    if not bypass:
+        response = await asyncio.to_thread(cache.get, key)
+        if response is not None:
+            count('llm_calls')
+            count('cache_hits')
+            return response
+
+    response = record_usage(prompt, await alimited_invoke(llm, messages, prompt))
+    await asyncio.to_thread(cache.put, key, response)
+    return response
@@ -1,132 +1,354 @@
+import io
 import os
-import PyPDF2
-import fitz # PyMuPDF
-import pdfplumber
-import pytesseract
-from PIL import Image
-import numpy as np
-import cv2
-from pdf2image import convert_from_path
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
-def extract_text_from_pdf(pdf_path, verbose=True):
+# PyMuPDF, pdfplumber, PyPDF2, pdf2image, PIL, OpenCV and pytesseract are imported inside
+# the functions that use them, so importing this module (e.g. for pages_to_text) stays cheap
+
+# Rendering resolution and tesseract language(s) for OCR, e.g. LEASE_OCR_LANG=eng+spa.
+# Both change the OCR text, so they are part of the extraction cache key.
+OCR_DPI = int(os.environ.get("LEASE_OCR_DPI", "200"))
+OCR_LANG = os.environ.get("LEASE_OCR_LANG", "eng")
+
+def load_pdf_source(pdf_source):
+    """
+    Normalize a PDF source into (path, pdf_bytes), exactly one of which is set.
+    Accepts a file path, raw bytes or a binary buffer such as BytesIO or a Streamlit upload.
+    Bytes are passed through untouched so every engine shares the same buffer.
+    """
+    if isinstance(pdf_source, (str, os.PathLike)):
+        return os.fspath(pdf_source), None
+    if isinstance(pdf_source, bytes):
+        return None, pdf_source
+    if isinstance(pdf_source, (bytearray, memoryview)):
+        return None, bytes(pdf_source)
+    if hasattr(pdf_source, 'getvalue'):
+        return None, pdf_source.getvalue()
+    return None, pdf_source.read()
+
+def _page_count(path, pdf_bytes):
+    from pdf2image import pdfinfo_from_bytes, pdfinfo_from_path
+    if path is not None:
+        return pdfinfo_from_path(path)["Pages"]
+    return pdfinfo_from_bytes(pdf_bytes)["Pages"]
+
+def iter_page_images(pdf_source, page_indexes=None, window=4, dpi=OCR_DPI):
     """
-    Function to extract text from a PDF file using multiple methods.
-    Returns text as soon as one method succeeds.
+    Rasterize a PDF a few pages at a time instead of all at once.
 
     Args:
-        pdf_path (str): Path to the PDF file
-        verbose (bool): Whether to print progress information
+        pdf_source (str | bytes | file-like): Path to the PDF file or its contents
+        page_indexes (list): Zero-based pages to render, None renders every page
+        window (int): Maximum number of consecutive pages rendered per pdf2image call
+        dpi (int): Rendering resolution
 
-    Returns:
-        tuple: (method_name, extracted_text) if successful, (None, None) if all methods fail
+    Yields:
+        tuple: (page_index, PIL image) in page order
     """
-    if not os.path.exists(pdf_path):
-        print(f"Error: File {pdf_path} does not exist.")
-        return None, None
+    from pdf2image import convert_from_bytes, convert_from_path
+    path, pdf_bytes = load_pdf_source(pdf_source)
+    if page_indexes is None:
+        page_indexes = range(_page_count(path, pdf_bytes))
 
-    if verbose:
-        print(f"Attempting to extract text from {pdf_path}")
+    for first, last in _page_windows(sorted(page_indexes), window):
+        if path is not None:
+            images = convert_from_path(path, dpi=dpi, first_page=first + 1, last_page=last + 1)
+        else:
+            images = convert_from_bytes(pdf_bytes, dpi=dpi, first_page=first + 1, last_page=last + 1)
+        for offset, image in enumerate(images):
+            yield first + offset, image
+        # Drop the window before rendering the next one
+        del images
 
-    # Method 1: PyPDF2
-    try:
-        if verbose:
-            print("Trying PyPDF2...")
+def iter_fitz_page_images(doc, page_indexes, dpi=OCR_DPI):
+    """
+    Rasterize selected pages of an already open PyMuPDF document one at a time.
 
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n\n"
+    Yields:
+        tuple: (page_index, PIL image) in page order
+    """
+    import fitz # PyMuPDF
+    from PIL import Image
+    for page_index in page_indexes:
+        pixmap = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=False)
+        image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+        del pixmap
+        yield page_index, image
 
-            if text.strip():
-                if verbose:
-                    print("PyPDF2 extraction successful.")
-                return "PyPDF2", text
-            elif verbose:
-                print("PyPDF2 extraction yielded no text.")
-    except Exception as e:
-        if verbose:
-            print(f"PyPDF2 extraction failed: {str(e)}")
+def _page_windows(page_indexes, window):
+    """Group sorted page indexes into runs of consecutive pages no longer than window."""
+    runs = []
+    for page_index in page_indexes:
+        if runs and page_index == runs[-1][1] + 1 and page_index - runs[-1][0] < window:
+            runs[-1][1] = page_index
+        else:
+            runs.append([page_index, page_index])
+    return [tuple(run) for run in runs]
 
-    # Method 2: PyMuPDF (fitz)
-    try:
-        if verbose:
-            print("Trying PyMuPDF...")
+def ocr_page_image(image, lang=OCR_LANG):
+    """
+    Threshold a single page image and run tesseract on it.
+    Kept at module level so it can be sent to worker processes.
+    """
+    import cv2
+    import numpy as np
+    import pytesseract
+    from PIL import Image
+
+    # Process the image before OCR to improve results
+    img_np = np.array(image)
+    gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
+    _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
+    pil_img = Image.fromarray(binary)
+
+    # Extract text using pytesseract
+    return pytesseract.image_to_string(pil_img, lang=lang)
 
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text += page.get_text() + "\n\n"
-        doc.close()
+def ocr_images(images, total, ocr_workers=None, verbose=True, progress_callback=None, lang=OCR_LANG):
+    """
+    OCR a stream of page images, fanning the pages out to a bounded process pool.
+    At most two pages per worker are held in memory at any time, so peak memory
+    does not grow with the length of the document.
+
+    Args:
+        images (iterable): (page_index, PIL image) pairs, e.g. from iter_page_images
+        total (int): Number of pages in the stream
+        ocr_workers (int): Number of worker processes, None uses every core and 1 runs in-process
+        verbose (bool): Whether to print per-page progress
+        progress_callback (callable): Optional callback(pages_done, total_pages)
+        lang (str): Tesseract language(s), e.g. 'eng' or 'eng+spa'
 
-        if text.strip():
+    Returns:
+        list: OCR text for each page, in page order
+    """
+    if ocr_workers is None:
+        ocr_workers = os.cpu_count() or 1
+    ocr_workers = max(1, min(ocr_workers, total))
+
+    page_texts = [""] * total
+    done = 0
+    if ocr_workers == 1:
+        for i, image in images:
             if verbose:
-                print("PyMuPDF extraction successful.")
-            return "PyMuPDF", text
-        elif verbose:
-            print("PyMuPDF extraction yielded no text.")
+                print(f"Processing page {done+1}/{total} with OCR...")
+            page_texts[i] = ocr_page_image(image, lang)
+            del image
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+        return page_texts
+
+    max_in_flight = ocr_workers * 2
+    with ProcessPoolExecutor(max_workers=ocr_workers) as executor:
+        pending = {}
+        for i, image in images:
+            pending[executor.submit(ocr_page_image, image, lang)] = i
+            del image
+            if len(pending) < max_in_flight:
+                continue
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += 1
+                page_texts[pending.pop(future)] = future.result()
+                if verbose:
+                    print(f"OCR finished page ({done}/{total})")
+                if progress_callback:
+                    progress_callback(done, total)
+
+        for future in as_completed(pending):
+            done += 1
+            page_texts[pending[future]] = future.result()
+            if verbose:
+                print(f"OCR finished page ({done}/{total})")
+            if progress_callback:
+                progress_callback(done, total)
+
+    return page_texts
+
+# Bump whenever a change here alters extracted text, so cached extractions are invalidated
+EXTRACTOR_VERSION = "1"
+
+MIN_PAGE_CHARS = 25
+
+def is_junk_text(text, min_chars=MIN_PAGE_CHARS):
+    """
+    Return True when a page's text layer is empty or unusable, e.g. a scanned
+    exhibit with no text layer or a layer made of unmapped glyph codes.
+    """
+    stripped = text.strip() if text else ""
+    if len(stripped) < min_chars:
+        return True
+    if "(cid:" in stripped or stripped.count("\ufffd") > len(stripped) * 0.05:
+        return True
+
+    visible = [c for c in stripped if not c.isspace()]
+    alnum = sum(c.isalnum() for c in visible)
+    return alnum / len(visible) < 0.5
+
+def _text_layer_pages(path, pdf_bytes, verbose=True):
+    """
+    Read the text layer of every page with the first engine that can open the file.
+    Engines read from the path when given one, otherwise from views over the same pdf_bytes.
+
+    Returns:
+        tuple: (engine_name, page_texts, doc) where doc is the open PyMuPDF document
+               when PyMuPDF was used, or (None, None, None) if no engine could read the file
+    """
+    # Engine 1: PyMuPDF (fitz), kept open so OCR pages can be rendered from the same document
+    try:
+        import fitz # PyMuPDF
+        if verbose:
+            print("Reading text layer with PyMuPDF...")
+        if path is not None:
+            doc = fitz.open(path)
+        else:
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        return "PyMuPDF", [page.get_text() for page in doc], doc
     except Exception as e:
         if verbose:
             print(f"PyMuPDF extraction failed: {str(e)}")
 
-    # Method 3: pdfplumber
+    # Engine 2: pdfplumber
     try:
         if verbose:
-            print("Trying pdfplumber...")
-
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                extracted = page.extract_text()
-                if extracted:
-                    text += extracted + "\n\n"
-
-        if text.strip():
-            if verbose:
-                print("pdfplumber extraction successful.")
-            return "pdfplumber", text
-        elif verbose:
-            print("pdfplumber extraction yielded no text.")
+            print("Reading text layer with pdfplumber...")
+        import pdfplumber
+        with pdfplumber.open(path if path is not None else io.BytesIO(pdf_bytes)) as pdf:
+            return "pdfplumber", [page.extract_text() or "" for page in pdf.pages], None
     except Exception as e:
         if verbose:
             print(f"pdfplumber extraction failed: {str(e)}")
 
-    # Method 4: OCR using pytesseract (last resort)
+    # Engine 3: PyPDF2
     try:
         if verbose:
-            print("All standard methods failed. Attempting OCR...")
+            print("Reading text layer with PyPDF2...")
+        import PyPDF2
+        pdf_reader = PyPDF2.PdfReader(path if path is not None else io.BytesIO(pdf_bytes))
+        return "PyPDF2", [page.extract_text() or "" for page in pdf_reader.pages], None
+    except Exception as e:
+        if verbose:
+            print(f"PyPDF2 extraction failed: {str(e)}")
 
-        # Convert PDF pages to images
-        images = convert_from_path(pdf_path)
-        text = ""
+    return None, None, None
 
-        for i, image in enumerate(images):
-            if verbose:
-                print(f"Processing page {i+1} with OCR...")
+def extract_pages_from_pdf(pdf_source, verbose=True, ocr_workers=None, progress_callback=None, dpi=OCR_DPI,
+                           lang=OCR_LANG, timings=None):
+    """
+    Extract text page by page in a single pass over the document.
+    The text layer is used wherever it is usable and only the remaining pages
+    (scanned exhibits, image-only rent schedules, garbled layers) are OCR'd.
 
-            # Process the image before OCR to improve results
-            img_np = np.array(image)
-            gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-            _, binary = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
-            pil_img = Image.fromarray(binary)
+    Args:
+        pdf_source (str | bytes | file-like): Path to the PDF file, its bytes or a binary buffer
+        verbose (bool): Whether to print progress information
+        ocr_workers (int): Worker processes for OCR, None uses every core
+        progress_callback (callable): Optional callback(pages_done, total_pages) for OCR progress
+        dpi (int): Resolution used when rendering pages for OCR
+        lang (str): Tesseract language(s) for OCR
+        timings (dict): Optional dict that receives 'text_layer' and 'ocr' durations in seconds,
+            and 'ocr_failed' set to True when pages needing OCR kept their text-layer text
 
-            # Extract text using pytesseract
-            page_text = pytesseract.image_to_string(pil_img)
-            text += page_text + "\n\n"
+    Returns:
+        list: One dict per page with 'page' (1-based), 'method' and 'text', or None if the file does not exist
+    """
+    path, pdf_bytes = load_pdf_source(pdf_source)
+    if path is not None and not os.path.exists(path):
+        print(f"Error: File {path} does not exist.")
+        return None
+
+    if verbose:
+        print(f"Attempting to extract text from {path or 'in-memory PDF'}")
 
-        if text.strip():
+    if timings is None:
+        timings = {}
+    started = time.perf_counter()
+    engine, page_texts, doc = _text_layer_pages(path, pdf_bytes, verbose=verbose)
+    timings['text_layer'] = time.perf_counter() - started
+    timings['ocr'] = 0.0
+    timings['ocr_failed'] = False
+    try:
+        if page_texts is None:
             if verbose:
-                print("OCR extraction successful.")
-            return "OCR", text
-        elif verbose:
-            print("OCR extraction yielded no text.")
-    except Exception as e:
-        if verbose:
-            print(f"OCR extraction failed: {str(e)}")
+                print("No text layer could be read. Falling back to OCR for every page...")
+            try:
+                page_texts = [""] * _page_count(path, pdf_bytes)
+            except Exception as e:
+                if verbose:
+                    print(f"OCR extraction failed: {str(e)}")
+                return []
+
+        pages = [{'page': i + 1, 'method': engine, 'text': page_text or ""} for i, page_text in enumerate(page_texts)]
+        ocr_indexes = [i for i, page_text in enumerate(page_texts) if is_junk_text(page_text)]
+
+        if ocr_indexes:
+            if verbose:
+                print(f"Running OCR on {len(ocr_indexes)} of {len(pages)} pages...")
+            started = time.perf_counter()
+            try:
+                if doc is not None:
+                    images = iter_fitz_page_images(doc, ocr_indexes, dpi=dpi)
+                else:
+                    images = iter_page_images(path if path is not None else pdf_bytes, ocr_indexes, dpi=dpi)
+                positions = {page_index: position for position, page_index in enumerate(ocr_indexes)}
+                ocr_texts = ocr_images(((positions[i], image) for i, image in images), len(ocr_indexes),
+                                       ocr_workers=ocr_workers, verbose=verbose,
+                                       progress_callback=progress_callback, lang=lang)
+                for page_index, ocr_text in zip(ocr_indexes, ocr_texts):
+                    if ocr_text.strip():
+                        pages[page_index]['text'] = ocr_text
+                        pages[page_index]['method'] = "OCR"
+            except Exception as e:
+                timings['ocr_failed'] = True
+                if verbose:
+                    print(f"OCR extraction failed: {str(e)}")
+            timings['ocr'] = time.perf_counter() - started
+    finally:
+        if doc is not None:
+            doc.close()
 
     if verbose:
-        print("All extraction methods failed.")
-    return None, None
+        for page in pages:
+            print(f"Page {page['page']}: {page['method'] or 'no text'}")
+    return pages
+
+def summarize_methods(pages):
+    """Collapse per-page methods into one label, e.g. 'PyMuPDF' or 'PyMuPDF+OCR'."""
+    methods = []
+    for page in pages:
+        if page['method'] and page['text'].strip() and page['method'] not in methods:
+            methods.append(page['method'])
+    return "+".join(methods) if methods else None
+
+def pages_to_text(pages):
+    """Join per-page text into the single string the graph nodes expect."""
+    return "".join(page['text'] + "\n\n" for page in pages)
+
+def extract_text_from_pdf(pdf_source, verbose=True, ocr_workers=None, progress_callback=None):
+    """
+    Function to extract text from a PDF file.
+    Pages are read from the text layer where possible and OCR'd otherwise,
+    see extract_pages_from_pdf.
+
+    Args:
+        pdf_source (str | bytes | file-like): Path to the PDF file, its bytes or a binary buffer
+        verbose (bool): Whether to print progress information
+        ocr_workers (int): Worker processes for OCR, None uses every core
+        progress_callback (callable): Optional callback(pages_done, total_pages) for OCR progress
+
+    Returns:
+        tuple: (method_name, extracted_text) if successful, (None, None) if all methods fail
+    """
+    pages = extract_pages_from_pdf(pdf_source, verbose=verbose, ocr_workers=ocr_workers,
+                                   progress_callback=progress_callback)
+    if pages is None:
+        return None, None
+
+    text = pages_to_text(pages)
+    if not text.strip():
+        if verbose:
+            print("All extraction methods failed.")
+        return None, None
 
+    return summarize_methods(pages), text
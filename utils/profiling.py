@@ -0,0 +1,83 @@
+import contextlib
+import datetime as dt
+import os
+import re
+import time
+
+# Set LEASE_PROFILE_DIR to profile every stage wrapped in profile_stage(); unset, the
+# wrappers are a shared no-op context manager and cProfile/tracemalloc are never imported
+PROFILE_DIR = os.environ.get("LEASE_PROFILE_DIR")
+TOP_ALLOCATIONS = int(os.environ.get("LEASE_PROFILE_TOP", "25"))
+
+_DISABLED = contextlib.nullcontext()
+_run_id = None
+_stage_number = 0
+
+
+def _stage_prefix(name):
+    """<run id>-<stage number>-<stage name>, so the dumps of one run sort together and in order."""
+    global _run_id, _stage_number
+    if _run_id is None:
+        _run_id = f"{dt.datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    _stage_number += 1
+    return os.path.join(PROFILE_DIR, f"{_run_id}-{_stage_number:02d}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}")
+
+
+@contextlib.contextmanager
+def _profile(name):
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prefix = _stage_prefix(name)
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - started
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+        # Binary dump for snakeviz / pstats, plus a readable summary
+        profiler.dump_stats(f"{prefix}.prof")
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative').print_stats(TOP_ALLOCATIONS)
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        growth = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        with open(f"{prefix}.txt", 'w', encoding='utf-8') as file:
+            file.write(f"stage: {name}\nwall seconds: {seconds:.3f}\n")
+            file.write(f"traced memory at end: {current / 2**20:.1f} MiB, peak during stage: {peak / 2**20:.1f} MiB\n")
+            file.write(f"\nTop {TOP_ALLOCATIONS} allocation sites by growth during the stage:\n")
+            for stat in growth[:TOP_ALLOCATIONS]:
+                file.write(f"  {stat}\n")
+            file.write(f"\nTop {TOP_ALLOCATIONS} functions by cumulative time (calling thread only):\n")
+            file.write(stats_text.getvalue())
+        print(f"Profiled {name}: {seconds:.2f}s, peak {peak / 2**20:.1f} MiB -> {prefix}.prof/.txt")
+
+
+def profile_stage(name):
+    """
+    Profile a block with cProfile and tracemalloc when LEASE_PROFILE_DIR is set.
+
+    Writes <dir>/<run>-<nn>-<name>.prof (cProfile stats) and .txt (peak memory, top
+    allocation sites and top functions). cProfile only sees the calling thread, so
+    for the graph stage it shows where the caller waits while the nodes run in
+    worker threads; tracemalloc covers every thread.
+    """
+    if PROFILE_DIR is None:
+        return _DISABLED
+    return _profile(name)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from utils.registry import Shared
+from utils.tokens import estimate_tokens
+from utils.tracing import count
+
+# Limits of the OpenAI account, shared by every lease in the process; 0 disables a limit
+DEFAULT_RPM = float(os.environ.get("LEASE_LLM_RPM", "500"))
+DEFAULT_TPM = float(os.environ.get("LEASE_LLM_TPM", "450000"))
+
+# Retries after a 429 or transient error: exponential backoff with full jitter, or Retry-After when sent
+MAX_RETRIES = int(os.environ.get("LEASE_LLM_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# After a 429 the limiter runs at a fraction of the configured rates and creeps back up on success
+MIN_RATE_SCALE = 0.1
+RATE_SCALE_RECOVERY = 0.05
+
+
+class RateLimiter:
+    """
+    Token bucket for requests per minute and tokens per minute.
+
+    Each call reserves one request and its estimated tokens up front and then
+    sleeps until the buckets could have paid for it, so callers are served in
+    arrival order and the limits hold across threads and event loops alike.
+    Buckets hold at most one minute of budget, which is the burst allowed.
+
+    A 429 pauses every caller for the Retry-After time and halves the effective
+    rates; each successful call then restores a little of the configured rate.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0
+        self._requests = rpm
+        self._tokens = tpm
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rate_limits = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm * self.scale / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm * self.scale / 60)
+
+    def reserve(self, tokens):
+        """Take one request and `tokens` tokens from the buckets and return how long to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+            if self.rpm:
+                self._requests -= 1
+                if self._requests < 0:
+                    wait = max(wait, -self._requests * 60 / (self.rpm * self.scale))
+            if self.tpm:
+                # A prompt larger than the whole bucket would otherwise never be sent
+                self._tokens -= min(tokens, self.tpm)
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens * 60 / (self.tpm * self.scale))
+
+            self.calls += 1
+            if wait > 0:
+                self.throttled += 1
+            self.queue_seconds += wait
+            self.max_queue_seconds = max(self.max_queue_seconds, wait)
+            return wait
+
+    def acquire(self, tokens):
+        """Block the calling thread until the request may be sent. Returns the queueing delay in seconds."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens):
+        """Async acquire, sleeping on the event loop instead of blocking it."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def rate_limited(self, retry_after):
+        """Record a 429: pause every caller for retry_after seconds and slow down."""
+        with self._lock:
+            self.retries += 1
+            self.rate_limits += 1
+            self.scale = max(MIN_RATE_SCALE, self.scale / 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def retried(self):
+        """Record a retry after a transient (non rate limit) failure."""
+        with self._lock:
+            self.retries += 1
+
+    def succeeded(self):
+        with self._lock:
+            self.scale = min(1.0, self.scale + RATE_SCALE_RECOVERY)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'rate_limits': self.rate_limits,
+                'queue_seconds': round(self.queue_seconds, 3),
+                'max_queue_seconds': round(self.max_queue_seconds, 3),
+                'mean_queue_seconds': round(self.queue_seconds / self.calls, 3) if self.calls else 0.0,
+                'rate_scale': self.scale,
+            }
+
+
+_limiter = Shared(RateLimiter)
+
+
+def get_rate_limiter():
+    """
+    The limiter limited_invoke uses when none is passed, sized by LEASE_LLM_RPM and
+    LEASE_LLM_TPM. Every lease in the process draws on it, since they share one account.
+    """
+    return _limiter.get()
+
+
+def is_rate_limit_error(error):
+    """True for an HTTP 429 from the OpenAI client (openai.RateLimitError or any error carrying status 429)."""
+    return getattr(error, 'status_code', None) == 429 or type(error).__name__ == 'RateLimitError'
+
+
+def is_transient_error(error):
+    """Timeouts, dropped connections and 5xx responses, which the OpenAI client would otherwise retry itself."""
+    status = getattr(error, 'status_code', None)
+    return (status is not None and (status >= 500 or status in (408, 409))) \
+        or type(error).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+
+def retry_after_seconds(error):
+    """The server's Retry-After (retry-after-ms, retry-after in seconds or as an HTTP date), or None."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(headers.get('retry-after')).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt, retry_after=None):
+    """Delay before retry number `attempt` (0-based): Retry-After plus jitter, else full-jitter exponential backoff."""
+    if retry_after is not None:
+        return min(BACKOFF_MAX_SECONDS, retry_after) + random.uniform(0, BACKOFF_BASE_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def request_tokens(llm, prompt):
+    """Tokens a request counts against TPM: the estimated prompt plus the max_tokens the server reserves."""
+    return estimate_tokens(prompt) + (getattr(llm, 'max_tokens', None) or 0)
+
+
+def limited_invoke(llm, messages, prompt, limiter=None, max_retries=MAX_RETRIES):
+    """
+    llm.invoke(messages) inside the rate limiter, retrying 429s and transient failures.
+
+    Args:
+        llm: LangChain chat model
+        messages (list): Messages to send
+        prompt (str): The rendered messages, used to estimate the token count
+        limiter (RateLimiter): Limiter to use, defaults to the process-wide one
+        max_retries (int): Retries before the error is raised
+
+    Returns:
+        The model response
+    """
+    # Offline backends such as utils.llm.ReplayLLM never reach the API
+    if not getattr(llm, 'rate_limited', True):
+        return llm.invoke(messages)
+    if limiter is None:
+        limiter = get_rate_limiter()
+    tokens = request_tokens(llm, prompt)
+    for attempt in range(max_retries + 1):
+        limiter.acquire(tokens)
+        try:
+            response = llm.invoke(messages)
+        except Exception as e:
+            if attempt == max_retries or not (is_rate_limit_error(e) or is_transient_error(e)):
+                raise
+            delay = backoff_seconds(attempt, retry_after_seconds(e))
+            print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt + 1} of {max_retries})")
+            count('retries')
+            if is_rate_limit_error(e):
+                # The pause is applied to every caller by the next acquire
+                limiter.rate_limited(delay)
+            else:
+                limiter.retried()
+                time.sleep(delay)
+            continue
+        limiter.succeeded()
+        return response
+
+
+async def alimited_invoke(llm, messages, prompt, limiter=None, max_retries=MAX_RETRIES):
+    """Async limited_invoke, awaiting llm.ainvoke."""
+    if not getattr(llm, 'rate_limited', True):
+        return await llm.ainvoke(messages)
+    if limiter is None:
+        limiter = get_rate_limiter()
+    tokens = request_tokens(llm, prompt)
+    for attempt in range(max_retries + 1):
+        await limiter.aacquire(tokens)
+        try:
+            response = await llm.ainvoke(messages)
+        except Exception as e:
+            if attempt == max_retries or not (is_rate_limit_error(e) or is_transient_error(e)):
+                raise
+            delay = backoff_seconds(attempt, retry_after_seconds(e))
+            print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s (attempt {attempt + 1} of {max_retries})")
+            count('retries')
+            if is_rate_limit_error(e):
+                # The pause is applied to every caller by the next acquire
+                limiter.rate_limited(delay)
+            else:
+                limiter.retried()
+                await asyncio.sleep(delay)
+            continue
+        limiter.succeeded()
+        return response
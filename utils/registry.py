@@ -0,0 +1,28 @@
+import threading
+
+
+class Shared:
+    """
+    One object per process, built by factory on the first get() and swappable with set().
+
+    Backs the get_*/configure_* pairs of utils.llm, utils.llm_cache, utils.rate_limit,
+    utils.tracing and utils.yield_curve. The lock makes concurrent first calls from
+    graph threads build a single instance.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._value is None:
+                self._value = self._factory()
+            return self._value
+
+    def set(self, value):
+        """Replace the shared object; later get() calls return value."""
+        with self._lock:
+            self._value = value
+            return value
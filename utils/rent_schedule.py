@@ -0,0 +1,173 @@
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+FREQUENCY_MONTHS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'semiannual': 6,
+    'semi-annual': 6,
+    'annual': 12,
+    'annually': 12,
+    'yearly': 12,
+}
+
+ESCALATION_TYPES = ('percent', 'amount', 'fixed')
+
+
+def _to_float(value, default=0.0) -> float:
+    try:
+        return float(str(value).replace('$', '').replace(',', '').replace('%', '').strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_date(value) -> Optional[np.datetime64]:
+    if not value:
+        return None
+    try:
+        date = np.datetime64(str(value)[:10], 'D')
+    except (TypeError, ValueError):
+        return None
+    return None if np.isnat(date) else date
+
+
+def normalize_rent_rules(rules: Any) -> Optional[Dict[str, Any]]:
+    """
+    Validate the rent-rule spec returned by the LLM and fill in defaults.
+    Returns None if there is no usable base rent.
+    """
+    if not isinstance(rules, dict):
+        return None
+
+    base_rent = _to_float(rules.get('base_rent'), default=None)
+    if base_rent is None:
+        return None
+
+    frequency = str(rules.get('frequency') or 'monthly').strip().lower()
+    payment_day = rules.get('payment_day')
+    first_payment_date = _to_date(rules.get('first_payment_date'))
+
+    escalations = []
+    for escalation in rules.get('escalations') or []:
+        if not isinstance(escalation, dict):
+            continue
+        kind = str(escalation.get('type', 'percent')).strip().lower()
+        effective_date = _to_date(escalation.get('effective_date'))
+        if kind not in ESCALATION_TYPES or effective_date is None:
+            print(f"Warning: Ignoring invalid rent escalation: {escalation}")
+            continue
+        escalations.append({
+            'type': kind,
+            'value': _to_float(escalation.get('value')),
+            'effective_date': str(effective_date),
+            'repeat_every_months': int(_to_float(escalation.get('repeat_every_months'), default=0) or 0),
+        })
+
+    abatements = []
+    for abatement in rules.get('abatements') or []:
+        if not isinstance(abatement, dict):
+            continue
+        start_date = _to_date(abatement.get('start_date'))
+        end_date = _to_date(abatement.get('end_date'))
+        if start_date is None or end_date is None:
+            print(f"Warning: Ignoring invalid rent abatement: {abatement}")
+            continue
+        abatements.append({
+            'start_date': str(start_date),
+            'end_date': str(end_date),
+            'percent': _to_float(abatement.get('percent', 100), default=100.0),
+        })
+
+    return {
+        'base_rent': base_rent,
+        'frequency': frequency if frequency in FREQUENCY_MONTHS else 'monthly',
+        'payment_day': int(_to_float(payment_day)) if payment_day not in (None, '') else None,
+        'first_payment_date': str(first_payment_date) if first_payment_date is not None else None,
+        'escalations': escalations,
+        'abatements': abatements,
+    }
+
+
+def _day_of_months(months: np.ndarray, day: int) -> np.ndarray:
+    """The given day of each month (datetime64[M]), clipped to the month's length."""
+    month_lengths = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(int)
+    return months.astype('datetime64[D]') + (np.minimum(day, month_lengths) - 1)
+
+
+def payment_dates(first_payment_date: str, end_date: str, frequency: str = 'monthly',
+                  payment_day: Optional[int] = None) -> np.ndarray:
+    """
+    Every payment date from first_payment_date through end_date (inclusive).
+
+    Dates step by whole months; payment_day (default: the day of first_payment_date)
+    is clipped to the length of each month, so the 31st becomes the 30th or 28th.
+    """
+    first = np.datetime64(first_payment_date, 'D')
+    last = np.datetime64(end_date, 'D')
+    step = FREQUENCY_MONTHS.get(frequency, 1)
+
+    first_month = first.astype('datetime64[M]')
+    month_count = (last.astype('datetime64[M]') - first_month).astype(int) // step + 1
+    months = first_month + np.arange(max(month_count, 0)) * step
+
+    day = payment_day or int((first - first_month.astype('datetime64[D]')).astype(int)) + 1
+    dates = _day_of_months(months, day)
+
+    return dates[(dates >= first) & (dates <= last)]
+
+
+def _escalation_events(escalation: Dict[str, Any], end_date: np.datetime64) -> List[np.datetime64]:
+    """
+    Effective dates of an escalation, expanding repeat_every_months up to end_date.
+
+    The day of the month is clipped like payment_dates does, so an escalation effective
+    on Jan 31 repeats on Feb 28 (29), and a Feb 29 anniversary falls on Feb 28.
+    """
+    effective = np.datetime64(escalation['effective_date'], 'D')
+    repeat = escalation['repeat_every_months']
+    if not repeat:
+        return [effective]
+
+    first_month = effective.astype('datetime64[M]')
+    day = int((effective - first_month.astype('datetime64[D]')).astype(int)) + 1
+    count = (end_date.astype('datetime64[M]') - first_month).astype(int) // repeat + 1
+    events = _day_of_months(first_month + np.arange(max(count, 0)) * repeat, day)
+    return [event for event in events if event <= end_date]
+
+
+def build_payment_schedule(rules: Dict[str, Any], start_date: str, end_date: str) -> Dict[str, float]:
+    """
+    Expand a normalized rent-rule spec into the payment_dates dictionary used downstream.
+
+    Escalations are applied in date order to every payment on or after their effective
+    date ('percent' compounds, 'amount' adds a flat increase, 'fixed' resets the rent),
+    then abatements scale payments inside their windows by (100 - percent)%.
+
+    Returns:
+        dict: {'YYYY-MM-DD': amount} for every payment date
+    """
+    first_payment_date = rules.get('first_payment_date') or start_date
+    dates = payment_dates(first_payment_date, end_date, rules['frequency'], rules.get('payment_day'))
+    amounts = np.full(dates.shape, rules['base_rent'], dtype=float)
+    last = np.datetime64(end_date, 'D')
+
+    events = []
+    for escalation in rules['escalations']:
+        for effective in _escalation_events(escalation, last):
+            events.append((effective, escalation['type'], escalation['value']))
+
+    for effective, kind, value in sorted(events, key=lambda event: event[0]):
+        applies = dates >= effective
+        if kind == 'percent':
+            amounts[applies] *= 1 + value / 100
+        elif kind == 'amount':
+            amounts[applies] += value
+        else:
+            amounts[applies] = value
+
+    for abatement in rules['abatements']:
+        window = (dates >= np.datetime64(abatement['start_date'], 'D')) & (dates <= np.datetime64(abatement['end_date'], 'D'))
+        amounts[window] *= max(0.0, 1 - abatement['percent'] / 100)
+
+    amounts = np.round(amounts, 2)
+    return {str(date): float(amount) for date, amount in zip(dates, amounts)}
@@ -0,0 +1,160 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Any, List, Optional
+
+from utils.doc_index import cite
+from utils.tokens import estimate_tokens
+
+# Set LEASE_RETRIEVAL=0 to always send the full lease text to the LLM
+RETRIEVAL_ENABLED = os.environ.get("LEASE_RETRIEVAL", "1") != "0"
+
+DEFAULT_TOP_K = 12
+DEFAULT_TOKEN_BUDGET = 6000
+MAX_PASSAGE_CHARS = 2500
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus adjacent-word bigrams so phrases like 'purchase option' score as a unit."""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{first}_{second}" for first, second in zip(words, words[1:])]
+
+
+def _split_span(text: str, start: int, end: int, max_chars: int) -> List[tuple]:
+    """Split a long span on paragraph breaks into chunks of at most roughly max_chars."""
+    chunks = []
+    chunk_start = start
+    while end - chunk_start > max_chars:
+        cut = text.rfind("\n\n", chunk_start + max_chars // 2, chunk_start + max_chars)
+        if cut == -1:
+            cut = text.rfind("\n", chunk_start + max_chars // 2, chunk_start + max_chars)
+        if cut == -1:
+            cut = chunk_start + max_chars
+        chunks.append((chunk_start, cut))
+        chunk_start = cut
+    chunks.append((chunk_start, end))
+    return chunks
+
+
+def build_passages(text: str, doc_index: Dict[str, Any], max_chars: int = MAX_PASSAGE_CHARS) -> List[Dict[str, Any]]:
+    """
+    Cut the lease into retrievable passages.
+    Sections from the document index are used when headings were found, otherwise pages;
+    either way long spans are split so one passage never dominates the budget.
+    """
+    if doc_index['sections']:
+        spans = [(section['start'], section['end']) for section in doc_index['sections']]
+        # Preamble before the first heading (parties, premises, dates) is often the most useful part
+        if spans[0][0] > 0:
+            spans.insert(0, (0, spans[0][0]))
+    else:
+        spans = [(page['start'], page['end']) for page in doc_index['pages']]
+
+    passages = []
+    for span_start, span_end in spans:
+        for start, end in _split_span(text, span_start, span_end, max_chars):
+            if text[start:end].strip():
+                passages.append({'start': start, 'end': end, 'label': cite(doc_index, start)})
+    return passages
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of passages, built locally with no network access."""
+
+    def __init__(self, text: str, passages: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.text = text
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+
+        self.term_counts = [Counter(tokenize(text[p['start']:p['end']])) for p in passages]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        document_frequency = Counter()
+        for counts in self.term_counts:
+            document_frequency.update(counts.keys())
+        n = len(passages)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def score(self, query_terms: List[str]) -> List[float]:
+        """BM25 score of every passage for a bag of query terms or phrases."""
+        query = Counter(tokenize(" ".join(query_terms)))
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in query:
+                tf = counts.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query_terms: List[str], top_k: int = DEFAULT_TOP_K,
+               token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+        """Best scoring passages that fit in token_budget, returned in document order."""
+        scores = self.score(query_terms)
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: scores[i], reverse=True)
+
+        selected = []
+        used = 0
+        for i in ranked[:top_k]:
+            passage = self.passages[i]
+            cost = estimate_tokens(self.text[passage['start']:passage['end']])
+            if used + cost > token_budget:
+                continue
+            selected.append(passage)
+            used += cost
+        return sorted(selected, key=lambda passage: passage['start'])
+
+
+# Small per-process cache so the seven nodes of one lease share a single index
+_INDEX_CACHE: "OrderedDict[str, BM25Index]" = OrderedDict()
+_INDEX_CACHE_SIZE = 8
+_index_cache_lock = threading.Lock()
+
+
+def get_retriever(text: str, doc_index: Dict[str, Any]) -> BM25Index:
+    """Return the BM25 index for a document, building it on first use. Safe to call from parallel nodes."""
+    key = doc_index['doc_id']
+    with _index_cache_lock:
+        retriever = _INDEX_CACHE.get(key)
+        if retriever is not None:
+            _INDEX_CACHE.move_to_end(key)
+            return retriever
+
+    # Built outside the lock so other leases are not held up; if another node of this
+    # lease got there first, its index is kept
+    retriever = BM25Index(text, build_passages(text, doc_index))
+    with _index_cache_lock:
+        retriever = _INDEX_CACHE.setdefault(key, retriever)
+        _INDEX_CACHE.move_to_end(key)
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return retriever
+
+
+def retrieve_context(state: Dict[str, Any], query_terms: List[str], top_k: int = DEFAULT_TOP_K,
+                     token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Text to put in a node's prompt: the lease passages most relevant to query_terms,
+    each prefixed with its section/page, within token_budget.
+
+    Falls back to the full lease text when retrieval is disabled, there is no document
+    index in the state, the whole lease already fits in the budget, or nothing matches.
+    """
+    text = state["text"]
+    doc_index: Optional[Dict[str, Any]] = state.get("doc_index")
+    if not RETRIEVAL_ENABLED or not doc_index or estimate_tokens(text) <= token_budget:
+        return text
+
+    passages = get_retriever(text, doc_index).search(query_terms, top_k=top_k, token_budget=token_budget)
+    if not passages:
+        return text
+
+    return "\n\n".join(f"[{passage['label']}]\n{text[passage['start']:passage['end']].strip()}" for passage in passages)
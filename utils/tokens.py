@@ -0,0 +1,6 @@
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English prose)."""
+    return len(text) // CHARS_PER_TOKEN + 1
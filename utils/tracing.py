@@ -0,0 +1,221 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.files import atomic_write
+from utils.registry import Shared
+
+# LEASE_TRACE_JSONL appends every finished span to a JSON lines file as it ends;
+# LEASE_METRICS_PROM is rewritten with the Prometheus text format after every lease
+TRACE_JSONL_PATH = os.environ.get("LEASE_TRACE_JSONL")
+METRICS_PROM_PATH = os.environ.get("LEASE_METRICS_PROM")
+
+# Upper bounds (seconds) of the Prometheus duration histogram buckets
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+# Counters every span carries; LLM calls inside a node add to the node's span
+COUNTERS = ('llm_calls', 'input_tokens', 'output_tokens', 'cache_hits', 'retries', 'parse_failures')
+
+_current_trace = contextvars.ContextVar("lease_trace", default=None)
+_current_span = contextvars.ContextVar("lease_span", default=None)
+
+
+class Tracer:
+    """
+    Collects spans (a stage of run_lease, a graph node) with their wall time and
+    LLM counters, and aggregates them for Prometheus.
+
+    Spans are kept in memory up to max_spans for inspection, streamed to
+    TRACE_JSONL_PATH when set, and folded into per (kind, name) totals that never
+    grow with the number of leases. record() takes a lock, as spans end on graph
+    worker threads and on event loops alike.
+    """
+
+    def __init__(self, jsonl_path=TRACE_JSONL_PATH, max_spans=10000):
+        self.jsonl_path = jsonl_path
+        self.max_spans = max_spans
+        self.spans = []
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            del self.spans[:-self.max_spans]
+
+            totals = self.totals.setdefault((span['kind'], span['name']), {
+                'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(SECONDS_BUCKETS),
+                **{counter: 0 for counter in COUNTERS},
+            })
+            totals['count'] += 1
+            totals['errors'] += span['error'] is not None
+            totals['seconds'] += span['seconds']
+            for i, bound in enumerate(SECONDS_BUCKETS):
+                if span['seconds'] <= bound:
+                    totals['buckets'][i] += 1
+            for counter in COUNTERS:
+                totals[counter] += span[counter]
+
+            if self.jsonl_path:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(span, default=str) + "\n")
+
+    def export_jsonl(self, path):
+        """Write the spans held in memory to a JSON lines file."""
+        with self._lock:
+            spans = list(self.spans)
+        with open(path, 'w', encoding='utf-8') as file:
+            for span in spans:
+                file.write(json.dumps(span, default=str) + "\n")
+
+    def prometheus_text(self):
+        """Totals in the Prometheus text exposition format."""
+        with self._lock:
+            totals = {key: dict(value, buckets=list(value['buckets'])) for key, value in self.totals.items()}
+
+        lines = [
+            "# HELP lease_span_seconds Wall time of pipeline stages and graph nodes.",
+            "# TYPE lease_span_seconds histogram",
+        ]
+        for (kind, name), total in sorted(totals.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            for bound, bucket_count in zip(SECONDS_BUCKETS, total['buckets']):
+                lines.append(f'lease_span_seconds_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'lease_span_seconds_bucket{{{labels},le="+Inf"}} {total["count"]}')
+            lines.append(f'lease_span_seconds_sum{{{labels}}} {total["seconds"]:.6f}')
+            lines.append(f'lease_span_seconds_count{{{labels}}} {total["count"]}')
+
+        descriptions = {
+            'errors': "Spans that raised an exception.",
+            'llm_calls': "LLM requests made, including cache hits.",
+            'input_tokens': "Prompt tokens sent to the LLM (estimated when the backend reports no usage).",
+            'output_tokens': "Completion tokens received from the LLM (estimated when the backend reports no usage).",
+            'cache_hits': "LLM requests answered from the response cache.",
+            'retries': "LLM requests retried after a rate limit or transient error.",
+            'parse_failures': "LLM responses that were not valid JSON or a valid answer.",
+        }
+        for counter, description in descriptions.items():
+            lines.append(f"# HELP lease_{counter}_total {description}")
+            lines.append(f"# TYPE lease_{counter}_total counter")
+            for (kind, name), total in sorted(totals.items()):
+                lines.append(f'lease_{counter}_total{{kind="{kind}",name="{name}"}} {total[counter]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Atomically rewrite a .prom file, e.g. for the node_exporter textfile collector."""
+        with atomic_write(path) as file:
+            file.write(self.prometheus_text())
+
+    def serve_prometheus(self, port, host="0.0.0.0"):
+        """Serve the metrics at http://host:port/metrics from a daemon thread. Returns the server."""
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = tracer.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+_tracer = Shared(Tracer)
+
+
+def get_tracer():
+    """The tracer every span() records into; batch exports its spans and totals after a run."""
+    return _tracer.get()
+
+
+@contextmanager
+def trace(lease=None):
+    """Group the spans of one lease run under a trace id. Yields the trace id; nested traces join the outer one."""
+    current_trace = _current_trace.get()
+    if current_trace is not None:
+        yield current_trace['trace_id']
+        return
+    trace_id = uuid.uuid4().hex[:16]
+    token = _current_trace.set({'trace_id': trace_id, 'lease': lease})
+    try:
+        yield trace_id
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name, kind='stage'):
+    """
+    Time a block as one span. LLM calls made inside it, including in nested
+    functions, threads started by the graph and awaited coroutines, are counted
+    on the innermost span. Yields the span dict.
+    """
+    current_trace = _current_trace.get() or {}
+    parent = _current_span.get()
+    record = {
+        'trace_id': current_trace.get('trace_id'),
+        'lease': current_trace.get('lease'),
+        'kind': kind,
+        'name': name,
+        'parent': parent['name'] if parent else None,
+        'start': time.time(),
+        'seconds': 0.0,
+        'error': None,
+        **{counter: 0 for counter in COUNTERS},
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        _current_span.reset(token)
+        get_tracer().record(record)
+
+
+def count(counter, amount=1):
+    """Add to a counter of the innermost open span; a no-op outside any span."""
+    record = _current_span.get()
+    if record is not None:
+        record[counter] += amount
+
+
+def traced_node(name):
+    """Decorator running a graph node (sync or async) inside span(name, kind='node')."""
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(state):
+                with span(name, kind='node'):
+                    return await function(state)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(state):
+            with span(name, kind='node'):
+                return function(state)
+        return wrapper
+    return decorator
+
+
+def write_metrics():
+    """Refresh the LEASE_METRICS_PROM file if one is configured."""
+    if METRICS_PROM_PATH:
+        get_tracer().write_prometheus(METRICS_PROM_PATH)
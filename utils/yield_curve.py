@@ -0,0 +1,508 @@
+import argparse
+import datetime as dt
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from utils.registry import Shared
+
+# Daily Treasury par yield curve CSV for one year. Set LEASE_TREASURY_CSV_URL to a local
+# path or mirror containing {year} to sync without home.treasury.gov
+TREASURY_CSV_URL = os.environ.get(
+    "LEASE_TREASURY_CSV_URL",
+    "https://home.treasury.gov/resource-center/data-chart-center/interest-rates/daily-treasury-rates.csv/{year}/all?type=daily_treasury_yield_curve&field_tdr_date_value={year}&page&_format=csv"
+)
+
+DEFAULT_STORE_PATH = os.environ.get(
+    "LEASE_YIELD_CURVE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "lease-accounting-analyzer", "yield_curve.sqlite3")
+)
+
+# Lookups are offline and only see what `python -m utils.yield_curve sync` or `load` put in the
+# store; LEASE_YIELD_CURVE_AUTO_SYNC=1 also downloads missing or stale years on lookup
+AUTO_SYNC = os.environ.get("LEASE_YIELD_CURVE_AUTO_SYNC", "0") == "1"
+# A year that was still running when it was synced is fetched again after this long
+SYNC_MAX_AGE_SECONDS = float(os.environ.get("LEASE_YIELD_CURVE_MAX_AGE_HOURS", "12")) * 60 * 60
+
+# Treasury CSV columns and their maturities in months, in curve order
+TENOR_COLUMNS = ('1 Mo', '1.5 Mo', '2 Mo', '3 Mo', '4 Mo', '6 Mo', '1 Yr', '2 Yr', '3 Yr', '5 Yr', '7 Yr',
+                 '10 Yr', '20 Yr', '30 Yr')
+TENOR_MONTHS = (1, 1.5, 2, 3, 4, 6, 12, 24, 36, 60, 84, 120, 240, 360)
+
+INTERPOLATION_METHODS = ('linear', 'monotone_cubic', 'log_linear')
+
+# Whole-month terms precomputed per curve date, and how many dates' grids are kept
+GRID_MONTHS = np.arange(1, 361)
+DEFAULT_GRID_DATES = int(os.environ.get("LEASE_YIELD_CURVE_GRID_DATES", "2048"))
+
+# datetime64[D] counts days from 1970-01-01, date.toordinal() from 0001-01-01
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
+def load_treasury_year(year, url=TREASURY_CSV_URL):
+    """Read the daily Treasury yield curve rates published for one calendar year."""
+    return pd.read_csv(url.format(year=year))
+
+
+class TermGridCache:
+    """
+    LRU cache of rates at every whole month 1-360, one float64 row (2.8 KiB) per curve
+    date and interpolation method, held as rows of one contiguous array.
+
+    Grids are built on first use, all missing ones in a single interpolate_curves call,
+    after which a lookup is an array index. Once max_dates grids are held, new grids
+    take the rows of the least recently used ones.
+    """
+
+    def __init__(self, max_dates=DEFAULT_GRID_DATES):
+        self.max_dates = max_dates
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()
+        self._grids = np.empty((0, len(GRID_MONTHS)))
+        self._lock = threading.Lock()
+
+    def _allocate(self, count):
+        """Rows for count new grids, growing the array or reusing the least recently used rows."""
+        free = max(0, min(count, self.max_dates - len(self._rows)))
+        rows = list(range(len(self._rows), len(self._rows) + free))
+        if rows and rows[-1] >= len(self._grids):
+            grown = np.empty((min(self.max_dates, max(2 * len(self._grids), rows[-1] + 1)), len(GRID_MONTHS)))
+            grown[:len(self._grids)] = self._grids
+            self._grids = grown
+        rows += [self._rows.popitem(last=False)[1] for _ in range(count - free)]
+        return rows
+
+    def rates(self, keys, curves, months, method='linear'):
+        """
+        Args:
+            keys (ndarray): The curve's key for each input, e.g. the curve date ordinal
+            curves (ndarray): The curve for each input, shape (len(keys), len(TENOR_MONTHS))
+            months (ndarray): Whole-month term for each input, within GRID_MONTHS
+            method (str): One of INTERPOLATION_METHODS
+
+        Returns:
+            ndarray: The grid rate for each input
+        """
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        if len(unique) > self.max_dates:
+            # More dates than the cache holds would only evict grids this call needs
+            return interpolate_curves(curves, months, method)
+
+        with self._lock:
+            rows = np.empty(len(unique), dtype=np.int64)
+            missing = []
+            for i, key in enumerate(unique.tolist()):
+                row = self._rows.get((key, method))
+                if row is None:
+                    missing.append(i)
+                else:
+                    self._rows.move_to_end((key, method))
+                    rows[i] = row
+            if missing:
+                built = interpolate_curves(curves[first[missing]], GRID_MONTHS[None, :], method)
+                for i, row, grid in zip(missing, self._allocate(len(missing)), built):
+                    self._grids[row] = grid
+                    self._rows[(unique[i].item(), method)] = row
+                    rows[i] = row
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+            return self._grids[rows[inverse], np.asarray(months, dtype=np.int64) - GRID_MONTHS[0]]
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'dates': len(self._rows)}
+
+
+class YieldCurveStore:
+    """
+    SQLite-backed store of daily Treasury par yield curves.
+
+    Curves are written by sync() (download whole years) or load_csv() (a local file in
+    the home.treasury.gov layout) and read back through an in-memory index sorted by
+    date, so on_or_before() and curves_on_or_before() are binary searches rather than
+    DataFrame scans. The SQLite connection and the index are guarded by a lock, so
+    discount_rate_node threads and asyncio.to_thread lookups can use one store.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, auto_sync=AUTO_SYNC, url=TREASURY_CSV_URL, grid_dates=DEFAULT_GRID_DATES):
+        self.path = path
+        self.auto_sync = auto_sync
+        self.url = url
+        self.grids = TermGridCache(grid_dates)
+        self._lock = threading.Lock()
+        # Held by ensure_synced while it decides what to download and downloads it, so
+        # concurrent lookups of a missing year sync it once; reads only take _lock
+        self._sync_lock = threading.Lock()
+        self._ordinals = None
+        self._rates = None
+        self._failed = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS curves (date TEXT PRIMARY KEY, rates TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS synced (year INTEGER PRIMARY KEY, synced_at REAL NOT NULL, source TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._synced = dict(self._conn.execute("SELECT year, synced_at FROM synced"))
+
+    def load_frame(self, df, source):
+        """
+        Store the curves of a DataFrame in the Treasury CSV layout, replacing curves of the same dates.
+
+        Args:
+            df (DataFrame): A 'Date' column and any of TENOR_COLUMNS; missing tenors are stored as NaN
+            source (str): URL or path recorded against the years the frame covers
+
+        Returns:
+            int: Number of curves stored
+        """
+        dates = pd.to_datetime(df['Date']).dt.date
+        columns = [pd.to_numeric(df[column], errors='coerce') if column in df else pd.Series(np.nan, index=df.index)
+                   for column in TENOR_COLUMNS]
+        rows = []
+        for i, date in enumerate(dates):
+            rates = [None if math.isnan(column.iloc[i]) else float(column.iloc[i]) for column in columns]
+            rows.append((date.isoformat(), json.dumps(rates)))
+
+        now = time.time()
+        years = sorted({date.year for date in dates})
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO curves (date, rates) VALUES (?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO synced (year, synced_at, source) VALUES (?, ?, ?)",
+                                   [(year, now, source) for year in years])
+            self._conn.commit()
+            self._synced.update({year: now for year in years})
+            self._ordinals = None
+        self.grids.clear()
+        return len(rows)
+
+    def load_csv(self, path):
+        """Store the curves of a local Treasury CSV file. Returns the number of curves stored."""
+        return self.load_frame(pd.read_csv(path), source=path)
+
+    def sync(self, years):
+        """
+        Download whole years of curves from self.url into the store.
+
+        Returns:
+            int: Number of curves stored
+        """
+        stored = 0
+        for year in years:
+            stored += self.load_frame(load_treasury_year(year, self.url), source=self.url.format(year=year))
+            print(f"Synced Treasury yield curves for {year}")
+        return stored
+
+    def ensure_synced(self, date):
+        """
+        Sync the year of date and the year before it (for rollbacks over New Year) unless
+        the store already has them. A year that had not ended when it was synced is synced
+        again once SYNC_MAX_AGE_SECONDS have passed, if date falls on or after that sync.
+        Download errors are printed and not retried for SYNC_MAX_AGE_SECONDS; lookups
+        then use whatever the store holds.
+        """
+        with self._sync_lock:
+            now = time.time()
+            with self._lock:
+                synced = dict(self._synced)
+            stale = []
+            for year in sorted({date.year, (date - dt.timedelta(days=365)).year}):
+                if now - self._failed.get(year, -math.inf) < SYNC_MAX_AGE_SECONDS:
+                    continue
+                synced_at = synced.get(year)
+                if synced_at is None:
+                    stale.append(year)
+                    continue
+                synced_on = dt.date.fromtimestamp(synced_at)
+                if synced_on <= dt.date(year, 12, 31) and date >= synced_on and now - synced_at > SYNC_MAX_AGE_SECONDS:
+                    stale.append(year)
+            for year in stale:
+                try:
+                    self.sync([year])
+                except Exception as e:
+                    self._failed[year] = now
+                    print(f"Could not sync Treasury yield curves for {year}: {e}")
+
+    def _index(self):
+        """Dates as sorted ordinals and the matching rates, (re)built after every write."""
+        with self._lock:
+            if self._ordinals is None:
+                rows = self._conn.execute("SELECT date, rates FROM curves ORDER BY date").fetchall()
+                self._ordinals = np.array([dt.date.fromisoformat(date).toordinal() for date, _ in rows], dtype=np.int64)
+                self._rates = np.array([[np.nan if rate is None else rate for rate in json.loads(rates)]
+                                        for _, rates in rows], dtype=float).reshape(len(rows), len(TENOR_COLUMNS))
+            return self._ordinals, self._rates
+
+    def on_or_before(self, date):
+        """
+        The most recent curve published on or before date.
+
+        Returns:
+            tuple: (curve date, array of rates in percent ordered as TENOR_MONTHS, NaN where not published)
+
+        Raises:
+            LookupError: If the store has no curve on or before date
+        """
+        ordinals, rates = self._index()
+        position = int(np.searchsorted(ordinals, date.toordinal(), side='right')) - 1
+        if position < 0:
+            raise LookupError(f"No Treasury yield curve on or before {date}; run python -m utils.yield_curve sync")
+        return dt.date.fromordinal(int(ordinals[position])), rates[position]
+
+    def curves_on_or_before(self, dates):
+        """
+        on_or_before() for many dates in one search.
+
+        Args:
+            dates (array-like): Dates, date strings or datetime64 values
+
+        Returns:
+            tuple: (array of curve dates as datetime64[D], rates array of shape (len(dates), len(TENOR_MONTHS)))
+
+        Raises:
+            LookupError: If any date falls before the first curve in the store
+        """
+        ordinals, rates = self._index()
+        positions = self._positions(ordinals, dates)
+        return (ordinals[positions] - _EPOCH_ORDINAL).astype('datetime64[D]'), rates[positions]
+
+    def grid_rates(self, dates, terms, method='linear'):
+        """
+        Interpolated rates for many (date, term) pairs, whole-month terms read from self.grids.
+
+        Returns the same rates as interpolate_curves on the curves from curves_on_or_before;
+        fractional terms are interpolated directly.
+
+        Returns:
+            tuple: (curve dates as datetime64[D], curves array, rates array)
+        """
+        ordinals, rates = self._index()
+        positions = self._positions(ordinals, dates)
+        curves = rates[positions]
+        terms = np.asarray(terms, dtype=float)
+        result = np.empty(len(terms))
+
+        # Terms beyond the grid take the end tenors' rates, so clipping keeps them exact
+        whole_months = np.clip(terms, GRID_MONTHS[0], GRID_MONTHS[-1])
+        whole = whole_months == np.round(whole_months)
+        if whole.any():
+            result[whole] = self.grids.rates(ordinals[positions[whole]], curves[whole], whole_months[whole], method)
+        if not whole.all():
+            result[~whole] = interpolate_curves(curves[~whole], terms[~whole], method)
+        return (ordinals[positions] - _EPOCH_ORDINAL).astype('datetime64[D]'), curves, result
+
+    @staticmethod
+    def _positions(ordinals, dates):
+        """Index into ordinals of the last curve on or before each date."""
+        days = _as_days(dates)
+        positions = np.searchsorted(ordinals, days.astype(np.int64) + _EPOCH_ORDINAL, side='right') - 1
+        if len(positions) and positions.min() < 0:
+            raise LookupError(f"No Treasury yield curve on or before {days[positions.argmin()]}; "
+                              "run python -m utils.yield_curve sync")
+        return positions
+
+    def coverage(self):
+        """(first date, last date, number of curves) held in the store, dates None when empty."""
+        ordinals, _ = self._index()
+        if not len(ordinals):
+            return None, None, 0
+        return dt.date.fromordinal(int(ordinals[0])), dt.date.fromordinal(int(ordinals[-1])), len(ordinals)
+
+
+def curve_frame(curve_date, rates):
+    """One curve as a single-row DataFrame with the Treasury CSV column names."""
+    return pd.DataFrame([[curve_date, *rates]], columns=['Date', *TENOR_COLUMNS])
+
+
+def _as_days(dates):
+    """Dates, ISO strings or datetime64 values as a datetime64[D] array; other formats go through pandas."""
+    try:
+        return np.asarray(dates, dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        return pd.to_datetime(np.asarray(dates)).values.astype('datetime64[D]')
+
+
+def _fill_missing_tenors(curves, months):
+    """Replace unpublished (NaN) tenors by linear interpolation along each curve, flat beyond the ends."""
+    missing = np.isnan(curves)
+    if not missing.any():
+        return curves
+    curves = curves.copy()
+    for row in np.flatnonzero(missing.any(axis=1)):
+        published = ~missing[row]
+        if published.any():
+            curves[row] = np.interp(months, months[published], curves[row, published])
+    return curves
+
+
+def _pchip_slopes(curves, months):
+    """Fritsch-Carlson derivatives at every tenor of every curve (the PCHIP rule, without scipy)."""
+    h = np.diff(months)
+    delta = np.diff(curves, axis=1) / h
+
+    slopes = np.zeros_like(curves)
+    # Interior points: weighted harmonic mean of the neighbouring secants, 0 at a local extremum
+    w1 = 2 * h[1:] + h[:-1]
+    w2 = h[1:] + 2 * h[:-1]
+    left, right = delta[:, :-1], delta[:, 1:]
+    same_sign = left * right > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = (w1 + w2) / (w1 / left + w2 / right)
+    slopes[:, 1:-1] = np.where(same_sign, harmonic, 0.0)
+
+    # End points: one-sided three-point estimate, kept shape preserving
+    for end, (h0, h1, d0, d1) in ((0, (h[0], h[1], delta[:, 0], delta[:, 1])),
+                                  (-1, (h[-1], h[-2], delta[:, -1], delta[:, -2]))):
+        slope = ((2 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+        slope = np.where(np.sign(slope) != np.sign(d0), 0.0, slope)
+        slope = np.where((np.sign(d0) != np.sign(d1)) & (np.abs(slope) > np.abs(3 * d0)), 3 * d0, slope)
+        slopes[:, end] = slope
+    return slopes
+
+
+def interpolate_curves(curves, terms, method='linear', months=TENOR_MONTHS):
+    """
+    Interpolate one rate per curve at the matching term, all rows in one NumPy pass.
+
+    Terms outside the first and last tenor take that tenor's rate, as calculate_discount_rate
+    does. Unpublished tenors (NaN, e.g. 1.5 Mo before 2025) are filled linearly from their
+    neighbours first.
+
+    Args:
+        curves (array-like): Rates in percent, shape (n, len(months))
+        terms (array-like): Term in months for each curve, length n; or 2-D, shape (n, m) or
+            (1, m), to evaluate m terms on every curve
+        method (str): 'linear'; 'monotone_cubic' (PCHIP, no overshoot between tenors); or
+            'log_linear' (linear in log discount factor, i.e. rate x term, flat forwards between tenors)
+        months (sequence): Tenor of each curve column in months, increasing
+
+    Returns:
+        ndarray: Interpolated rates in percent, length n (or shape (n, m) for 2-D terms)
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"Unknown interpolation method {method!r}, expected one of {INTERPOLATION_METHODS}")
+    months = np.asarray(months, dtype=float)
+    curves = _fill_missing_tenors(np.atleast_2d(np.asarray(curves, dtype=float)), months)
+    terms = np.clip(np.asarray(terms, dtype=float), months[0], months[-1])
+    if terms.ndim == 1:
+        return interpolate_curves(curves, terms[:, None], method, months)[:, 0]
+
+    # Segment [months[k], months[k + 1]] holding each term, and the position s within it
+    k = np.clip(np.searchsorted(months, terms, side='right') - 1, 0, len(months) - 2)
+    x0, x1 = months[k], months[k + 1]
+    y0, y1 = np.take_along_axis(curves, k, axis=1), np.take_along_axis(curves, k + 1, axis=1)
+    h = x1 - x0
+    s = (terms - x0) / h
+
+    if method == 'linear':
+        return y0 + s * (y1 - y0)
+    if method == 'log_linear':
+        return ((1 - s) * y0 * x0 + s * y1 * x1) / terms
+
+    slopes = _pchip_slopes(curves, months)
+    d0, d1 = np.take_along_axis(slopes, k, axis=1), np.take_along_axis(slopes, k + 1, axis=1)
+    s2, s3 = s * s, s * s * s
+    return ((2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * h * d0
+            + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * h * d1)
+
+
+def risk_free_rates(dates, terms, method='linear', store=None):
+    """
+    Treasury risk-free rates for many (commencement date, term) pairs at once.
+
+    Each date uses the most recent curve on or before it, as calculate_discount_rate does,
+    and whole-month terms are read from the store's precomputed term grids.
+
+    Args:
+        dates (array-like): Commencement dates, date strings or datetime64 values
+        terms (array-like): Lease terms in months, same length as dates
+        method (str): One of INTERPOLATION_METHODS, see interpolate_curves
+        store (YieldCurveStore): Defaults to the process-wide store
+
+    Returns:
+        DataFrame: One row per input with 'Commencement Date', 'Term (Months)', 'Risk-Free Rate'
+        and, for audit, the curve used: 'Curve Date' and its TENOR_COLUMNS rates
+    """
+    store = store or get_yield_curve_store()
+    days = _as_days(dates)
+    terms = np.asarray(terms, dtype=float)
+    if len(days) != len(terms):
+        raise ValueError(f"Got {len(days)} dates and {len(terms)} terms")
+
+    if store.auto_sync and len(days):
+        years = days.astype('datetime64[Y]')
+        for year in np.unique(years):
+            store.ensure_synced(days[years == year].max().astype(dt.date))
+
+    curve_days, curves, rates = store.grid_rates(days, terms, method)
+    result = pd.DataFrame({
+        'Commencement Date': days,
+        'Term (Months)': terms,
+        'Risk-Free Rate': rates,
+        'Curve Date': curve_days,
+    })
+    result[list(TENOR_COLUMNS)] = curves
+    return result
+
+
+_store = Shared(YieldCurveStore)
+
+
+def get_yield_curve_store():
+    """The store calculate_discount_rate and risk_free_rates read: LEASE_YIELD_CURVE_PATH unless configured."""
+    return _store.get()
+
+
+def configure_yield_curve_store(path=DEFAULT_STORE_PATH, auto_sync=AUTO_SYNC, store=None):
+    """
+    Switch the process-wide store, e.g. to a fixture file in a benchmark.
+
+    Args:
+        path (str): SQLite file to open (":memory:" for a throwaway store)
+        auto_sync (bool): Download missing years on lookup
+        store (YieldCurveStore): Use this store instead
+
+    Returns:
+        YieldCurveStore: The new store
+    """
+    return _store.set(store if store is not None else YieldCurveStore(path, auto_sync=auto_sync))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the local Treasury yield curve store.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="SQLite file of the store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    sync_command = commands.add_parser("sync", help="Download whole years from LEASE_TREASURY_CSV_URL")
+    sync_command.add_argument("years", type=int, nargs="*", help="Years to sync (default: the last two)")
+    load_command = commands.add_parser("load", help="Load local CSV files in the home.treasury.gov layout")
+    load_command.add_argument("files", nargs="+")
+    commands.add_parser("show", help="Print the dates the store covers")
+    args = parser.parse_args()
+
+    store = YieldCurveStore(args.store)
+    if args.command == "sync":
+        this_year = dt.date.today().year
+        store.sync(args.years or [this_year - 1, this_year])
+    elif args.command == "load":
+        for path in args.files:
+            print(f"Loaded {store.load_csv(path)} curves from {path}")
+    first, last, curves = store.coverage()
+    print(f"{args.store}: {curves} curves from {first} to {last}")
+
+
+if __name__ == "__main__":
+    main()